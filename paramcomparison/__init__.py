@@ -14,32 +14,126 @@
 # ParamComparison. If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function
+import collections
 import copy
+import functools
 import itertools
 import os
 import sys
+import time
+
+import six
 
 __version__ = '0.2.1'
 
-class ParamComparison:
+class ParamComparison(object):
     """
     A class to initiate the generation of pages
 
     :type grid: dict: str -> (val0, val1, ...)
-    :param grid: A dictionary whose keys are strings of variable names and values are sequences of
-         values to be tried for the corresponding variable.
+    :param grid: A dictionary whose keys are strings of variable names and values are sequences (or
+         other iterables) of values to be tried for the corresponding variable.
     :type reader: :class:`readers.Reader` (or its subclass) object
     :param reader: The Reader class to load and process data.
+    :type jobs: int
+    :param jobs: The number of cells to evaluate in parallel. :attr:`results` is in the order of
+         the grid regardless (except on Python 2, where dicts keep no order).
+    :type timeout: float
+    :param timeout: The deadline in seconds of evaluating each cell. ``None`` means no deadline.
+    :param timeout_value: The result of the cells which exceed the deadline.
+    :type speculate_after: float
+    :param speculate_after: The fraction of completed cells after which the slowest running cells
+         are re-executed by idle workers. ``None`` disables speculative re-execution.
+    :type budget: int
+    :param budget: If not ``None``, only evaluate a sample of this many cells. See :func:`fill`.
+    :type time_budget: float
+    :param time_budget: If not ``None``, only evaluate a sample of cells for this many seconds. See
+         :func:`fill`.
+    :type seed: int
+    :param seed: The seed of the sampling. See :func:`fill`.
+    :type processes: bool
+    :param processes: Whether to evaluate cells in ``jobs`` worker processes rather than threads.
+         The reader is then sent to each worker process once, where it is opened before evaluating
+         any cell and closed when the worker exits (see :func:`evaluation.init_worker`). Otherwise,
+         the reader is opened and closed in the calling process around each evaluation, unless it
+         is already open, e.g., in a ``with reader:`` block.
+    :type on_result: function
+    :param on_result: If not ``None``, a function called with ``params`` (as returned by
+         :func:`cell_params`) and the result string (or the dict of metric strings, see
+         :attr:`metrics`) whenever a cell is evaluated, in the order of completion.
+    :type lazy: bool
+    :param lazy: If true, no cells are evaluated on creation; they can be evaluated later by
+         :func:`fill` or :func:`iter_results`.
+    :type cost: function or dict
+    :param cost: If not ``None``, the estimated cost of the cells, by which the cells evaluated in
+         parallel are scheduled, the most expensive first: either a function called with
+         ``params`` (as returned by :func:`cell_params`), or the times recorded in a previous run
+         (:attr:`timings`) from which the costs of all cells are estimated by
+         :func:`evaluation.cost_model`.
     :raise TypeError: When ``reader`` is not an instance of :class:`readers.Reader`.
+
+    If the reader declares :attr:`readers.Reader.metrics`, the metrics of each cell are stored
+    column-wise in :attr:`metric_results`, and :attr:`results` is the column of the first metric.
+    :func:`metric` gives a view of the results of any metric, and :func:`generate_pages` writes the
+    pages of each metric.
+
+    .. seealso:: :func:`evaluation.evaluate` for the details of parallel evaluation.
     """
 
-    def __init__(self, grid, reader):
+    def __init__(self, grid, reader, jobs = 1, timeout = None, timeout_value = 'timeout',
+                 speculate_after = None, budget = None, time_budget = None, seed = None,
+                 processes = False, on_result = None, lazy = False, cost = None):
 
         # assure reader is valid
         from .readers import Reader
         if not isinstance(reader, Reader):
             raise TypeError('Invalid reader. Must be an instance of paramcomparison.writers.Reader')
 
+        self._init_grid(grid, reader.metrics)
+        self.reader = reader
+        self._evaluation_options = (jobs, timeout, timeout_value, speculate_after)
+        self.processes = processes
+        self.on_result = on_result
+        self.cost = cost
+        if not lazy:
+            self.fill(budget, time_budget, seed)
+
+    @classmethod
+    def from_results(cls, grid, results):
+        """
+        Create an object from existing results, e.g., results loaded from a file, without
+        evaluating anything. Its :attr:`reader` is ``None``, so it can't evaluate any cells.
+
+        :type grid: dict: str -> (val0, val1, ...)
+        :param grid: See :class:`ParamComparison`.
+        :type results: dict: tuple -> str
+        :param results: The results, whose keys are tuples of the values (as strings) of the fields
+             in the order of ``grid``. Results of cells which are not in the grid are ignored, and
+             cells which have no results are not evaluated.
+        :rtype: :class:`ParamComparison`
+        """
+
+        self = cls.__new__(cls)
+        self._init_grid(grid)
+        self.reader = None
+        self._evaluation_options = (1, None, 'timeout', None)
+        self.processes = False
+        self.on_result = None
+        self.cost = None
+        for k, v in six.iteritems(results):
+            if k in self.results and v is not None:
+                self.results[k] = str(v)
+        return self
+
+    def _init_grid(self, grid, metrics = ()):
+        """
+        Initialize the fields, the grid and the empty results of each metric.
+        """
+
+        # materialize each sequence of values once, so that any iterable (such as a generator) can
+        # be used
+        grid = collections.OrderedDict((k, tuple(v)) for k, v in grid.items())
+
         self.names = tuple(grid.keys())
         self.name_idx = dict() # reverse look up (name --> index)
         for i in range(0, len(self.names)):
@@ -49,114 +143,1448 @@ class ParamComparison:
             v = i[1]
             self.grid[i[0]] = tuple(map(str, v))
 
-        self.results = dict()
+        self._raw_grid = grid
+        self._raw_values = None # lazily built by cell_params
+        self.timings = dict() # key -> the time in seconds the cell has taken to evaluate
+
+        # store all results to a dictionary to be used for further looking up. Cells which are not
+        # evaluated yet have None as results. The cells are kept in the order of the grid, whatever
+        # order they are evaluated in, where dicts keep the insertion order (python >= 3.7);
+        # on python 2 their order is arbitrary.
+        self.results = dict.fromkeys(itertools.product(*(self.grid[n] for n in self.names)))
+
+        # one column of results per metric, sharing the keys
+        self.metrics = tuple(metrics)
+        self.metric_results = collections.OrderedDict(
+            (m, dict.fromkeys(self.results) if i else self.results)
+            for i, m in enumerate(self.metrics))
+
+    def fill(self, budget = None, time_budget = None, seed = None):
+        """
+        Evaluate the cells which are not evaluated yet. Without budgets, all of them are evaluated
+        in the order of the grid. With a budget, a space-filling sample of them is evaluated: cells
+        are drawn in rounds of Latin hypercube designs over the values of all fields, so that every
+        value of every field is covered as evenly as possible; this function can be called again
+        later to evaluate more cells, without evaluating the sampled cells again.
+
+        If the reader declares :attr:`readers.Reader.expensive_params`, the cells to evaluate are
+        grouped by the values of these parameters, and the groups are evaluated one after another
+        (the cells of a group possibly in parallel), between the calls of
+        :func:`readers.Reader.setup` and :func:`readers.Reader.teardown`.
+
+        :type budget: int
+        :param budget: The maximum number of cells to evaluate. ``None`` means no limit.
+        :type time_budget: float
+        :param time_budget: The time in seconds after which no more cells are evaluated. The cells
+             being evaluated at that time are still completed in serial mode, and discarded in
+             parallel mode. ``None`` means no limit.
+        :type seed: int
+        :param seed: The seed of the random sampling.
+        :return: The number of cells evaluated.
+        :rtype: int
+        :raise ValueError: When there is no :attr:`reader`, e.g., for objects created by
+             :func:`from_results`.
+        """
+
+        return sum(1 for cell in self.iter_results(budget, time_budget, seed))
+
+    def iter_results(self, budget = None, time_budget = None, seed = None):
+        """
+        Like :func:`fill`, but generate the results as soon as the cells are evaluated (in the
+        order of completion in parallel mode), so that they can be consumed while the evaluation
+        is still running. The results are also stored in :attr:`results`. The evaluation stops when
+        the generator is closed, e.g., when the loop consuming it is broken: in parallel mode, the
+        cells not started yet are skipped and the cells being evaluated are waited for.
+
+        :return: A generator of ``(params, result)``, where ``params`` is as returned by
+             :func:`cell_params` and ``result`` is the result string, or a dict of the strings of
+             the metrics if there are :attr:`metrics`.
+
+        .. seealso:: :func:`fill` for the parameters and the exceptions.
+        """
+
+        start = time.time()
+        results = self.results
+        names = self.names
+        raw_values = tuple(self._raw_grid[n] for n in names)
+        str_values = tuple(self.grid[n] for n in names)
+        shape = tuple(len(v) for v in raw_values)
+
+        def is_pending(idx):
+            return results[tuple(v[i] for v, i in zip(str_values, idx))] is None
+
+        if budget is None and time_budget is None:
+            pending = (idx for idx in itertools.product(*(range(n) for n in shape))
+                       if is_pending(idx))
+        else:
+            pending = _iter_sample(is_pending, shape, seed)
+            if budget is not None:
+                pending = itertools.islice(pending, budget)
+        cells = ((tuple(v[i] for v, i in zip(str_values, idx)),
+                  dict(zip(names, (v[i] for v, i in zip(raw_values, idx))))) for idx in pending)
+
+        return self._iter_evaluate(cells, start, time_budget)
+
+    def _iter_evaluate(self, cells, start, time_budget = None):
+        """
+        Evaluate cells, store their results and call :attr:`on_result`.
+
+        :type cells: iterable of (key, params)
+        :param cells: The cells, as passed to :func:`evaluation.evaluate`.
+        :type start: float
+        :param start: The time the time budget counts from.
+        :return: A generator of ``(params, result)`` of the evaluated cells.
+        """
+
+        from .evaluation import evaluate, init_worker, read_in_worker, cost_model
+
+        reader = self.reader
+        if reader is None:
+            raise ValueError('Cells cannot be evaluated without a reader')
+        jobs, timeout = self._evaluation_options[:2]
+        if self.cost is None:
+            cost = None
+        elif callable(self.cost):
+            cost = lambda key, params: self.cost(params)
+        else:
+            model = cost_model(self.cost)
+            cost = lambda key, params: model(key)
+        pool = None
+        if self.processes and jobs > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs, init_worker, (reader,))
+        else: # left open if the caller has opened it
+            reader.__enter__()
+
+        expensive_idx = tuple(self._field_index(n) for n in reader.expensive_params)
+        followers = {} # key of a cell read -> keys of the cells sharing its result
+        done = {} # key of a cell read with followers -> result
+        ready = [] # (key, result) of the cells whose result has already been read
+        cells = _dedup_cells(cells, reader, self.names, followers, done, ready)
+        try:
+            for group_params, group_cells in _group_cells(cells, expensive_idx, self.names):
+                if pool is not None: # setup and teardown are called in the workers
+                    read = functools.partial(_apply, pool, read_in_worker, group_params)
+                else:
+                    read = reader.read
+                try:
+                    if pool is None and group_params is not None:
+                        reader.setup(group_params)
+                    results_iter = evaluate(read, group_cells, *self._evaluation_options,
+                                            cost = cost, timings = self.timings)
+                    try:
+                        for key, result in results_iter:
+                            result = _result_strings(result, self.metrics)
+                            batch = [(key, result)]
+                            if key in followers:
+                                done[key] = result
+                                batch.extend((k, result) for k in followers.pop(key))
+                            batch.extend(ready)
+                            del ready[:]
+                            for cell in self._store_results(batch):
+                                yield cell
+                            if time_budget is not None and time.time() - start >= time_budget:
+                                return
+                    finally:
+                        results_iter.close()
+                finally:
+                    if pool is None and group_params is not None:
+                        reader.teardown()
+            for cell in self._store_results(ready):
+                yield cell
+        finally:
+            if pool is None:
+                reader.__exit__(None, None, None)
+            elif timeout is None:
+                pool.close()
+                pool.join()
+            else: # some workers may be stuck in cells exceeding the deadline
+                pool.terminate()
+
+    def _store_results(self, cells):
+        """
+        Store results and call :attr:`on_result`.
+
+        :type cells: iterable of (key, result)
+        :param cells: The keys of the cells and their result strings.
+        :return: A generator of ``(params, result)`` of the cells.
+        """
+
+        for key, result in cells:
+            if self.metrics:
+                for m, column in six.iteritems(self.metric_results):
+                    column[key] = result[m]
+            else:
+                self.results[key] = result
+            params = self.cell_params(key)
+            if self.on_result is not None:
+                self.on_result(params, result)
+            yield params, result
+
+    def reevaluate(self, keys):
+        """
+        Evaluate the given cells again, whether they have been evaluated or not.
+
+        :type keys: iterable of tuples
+        :param keys: The keys of the cells in :attr:`results`.
+        :return: The number of cells evaluated.
+        :rtype: int
+        :raise ValueError: When there is no :attr:`reader`.
+        """
+
+        return sum(1 for cell in self._iter_evaluate([(k, self.cell_params(k)) for k in keys],
+                                                     time.time()))
+
+    def metric(self, name):
+        """
+        Create a view of the results of a metric, which shares the grid and the column of results
+        with this object and can be used like a single-metric object, e.g., to generate pages or
+        compute statistics. Like :func:`from_results`, its :attr:`reader` is ``None``.
+
+        :type name: str
+        :param name: The name of the metric.
+        :rtype: :class:`ParamComparison`
+        :raise ValueError: When the metric does not exist.
+        """
+
+        if name not in self.metric_results:
+            raise ValueError('Metric "{}" does not exist'.format(name))
+        view = copy.copy(self)
+        view.reader = None
+        view.results = self.metric_results[name]
+        view.metrics = ()
+        view.metric_results = collections.OrderedDict()
+        return view
+
+    def slice(self, **fixed):
+        """
+        Create a view of the results of the cells in which some fields have the given values, e.g.,
+        ``pc.slice(theta = 0.52, g = 9.8)``. The results are not copied.
+
+        :param fixed: The values of the fixed fields. They are compared as strings with the values
+             in the grid.
+        :rtype: :class:`slices.GridSlice`
+        :raise ValueError: When a field or a value does not exist.
+        """
+
+        from .slices import GridSlice
+
+        values = dict()
+        for name, value in six.iteritems(fixed):
+            value = str(value)
+            if value not in self.grid[self.names[self._field_index(name)]]:
+                raise ValueError('Value "{}" of field "{}" does not exist'.format(value, name))
+            values[name] = value
+        return GridSlice(self, values)
+
+    def cell_params(self, key):
+        """
+        :type key: tuple
+        :param key: The key of a cell in :attr:`results`.
+        :return: The parameters of the cell as passed to :func:`readers.Reader.read`, with the
+             values as given in the grid rather than strings.
+        :rtype: dict
+        """
+
+        if self._raw_values is None:
+            self._raw_values = tuple(dict(zip(self.grid[n], self._raw_grid[n]))
+                                     for n in self.names)
+        return dict(zip(self.names, (raw[v] for raw, v in zip(self._raw_values, key))))
+
+    def count_missing(self):
+        """
+        :return: The number of cells which are not evaluated yet.
+        :rtype: int
+        """
 
-        # store all results to a dictionary to be used for further looking up
-        for params in itertools.product(*grid.values()):
-            func_params = dict(zip(self.names, params))
-            result = str(reader.read(func_params))
-            values = tuple(map(str, params))
-            self.results[values] = result
+        return sum(1 for v in six.itervalues(self.results) if v is None)
 
-    def generate_pages(self, outdir, writer, row_field, col_field):
+    def generate_pages(self, outdir, writer, row_field, col_field, max_rows = None,
+                       max_cols = None, max_tables = None, max_bytes = None,
+                       memory_budget = None, metrics = None, jobs = 1):
         """
         Generate a set of pages
 
-        :type outdir: str
-        :param outdir: The directory to write files to.
-        :type writer: :class:`writers.Writer` (or its subclass) object
-        :param writer: The writer to be used.
+        :type outdir: str or :class:`outputs.Output`, or a sequence of them
+        :param outdir: The directory to write files to, or the output to write the pages to. If
+             ``writer`` is a sequence, a sequence of as many directories or outputs, one per writer.
+        :type writer: :class:`writers.Writer` (or its subclass) object, or a sequence of them
+        :param writer: The writer to be used. If a sequence of writers is given, the pages are
+             generated with all of them in a single traversal of :attr:`results`: the entries of
+             each table are collected once and rendered by every writer. Each writer then keeps
+             the page it is rendering in memory until it is complete, so ``max_tables`` or
+             ``max_bytes`` bound the memory used for the rendered pages.
         :type row_field: str
         :param row_field: The field to be used in rows.
         :type col_field: str
         :param col_field: The field to be used in columns.
+        :type max_rows: int
+        :param max_rows: If not ``None``, tables with more rows are split into tiles of at most this
+             many rows.
+        :type max_cols: int
+        :param max_cols: If not ``None``, tables with more columns are split into tiles of at most
+             this many columns.
+        :type max_tables: int
+        :param max_tables: If not ``None``, pages with more tables (or tiles) are split into
+             numbered pages ``<name>-1``, ``<name>-2``, etc. with at most this many tables each,
+             and the page ``<name>`` becomes an index of them (see
+             :func:`writers.Writer.write_index`).
+        :type max_bytes: int
+        :param max_bytes: If not ``None``, pages larger than about this many characters are split
+             like ``max_tables``.
+        :type memory_budget: int
+        :param memory_budget: If not ``None``, read :attr:`results` sequentially in chunks of at
+             most this many cells, which is much faster when the results are stored on disk. Every
+             chunk consists of whole tables, in the order in which they are written.
+        :type metrics: sequence of str
+        :param metrics: If there are :attr:`metrics`, the metrics to write the pages of, each to its
+             own subdirectory of ``outdir`` named after the metric (or with the file names prefixed
+             by ``<metric>/`` if ``outdir`` is an output). If ``None``, all metrics.
+        :type jobs: int
+        :param jobs: The number of writers rendering concurrently, if several writers are given.
         :return: None
         :raise TypeError: When ``writer`` is not an instance of :class:`writers.Writer`.
+        :raise ValueError: When a metric does not exist, or the numbers of writers and outputs
+             differ.
         """
 
         # make sure writer is valid
+        from .writers import Writer
+        single = isinstance(writer, Writer)
+        writers = (writer,) if single else tuple(writer)
+        outdirs = (outdir,) if single else tuple(outdir)
+        for w in writers:
+            if not isinstance(w, Writer):
+                raise TypeError(
+                    'Invalid writer. Must be an instance of paramcomparison.writers.Writer')
+        if len(writers) != len(outdirs):
+            raise ValueError('{} writers are given with {} outputs'.format(len(writers),
+                                                                           len(outdirs)))
+
+        if self.metrics:
+            metrics = self.metrics if metrics is None else tuple(metrics)
+            views = [self.metric(m) for m in metrics] # validate all metrics before writing
+            for m, view in zip(metrics, views):
+                sub_outdirs = [_sub_outdir(d, m) for d in outdirs]
+                view.generate_pages(sub_outdirs[0] if single else sub_outdirs, writer, row_field,
+                                    col_field, max_rows, max_cols, max_tables, max_bytes,
+                                    memory_budget, jobs = jobs)
+            return
+
+        # the index of the row and column field
+        row_field_idx = self._field_index(row_field)
+        col_field_idx = self._field_index(col_field)
+
+        from .outputs import Output, DirectoryOutput
+        outputs = [d if isinstance(d, Output) else DirectoryOutput(d) for d in outdirs]
+        pool = None
+        if jobs > 1 and len(writers) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(jobs, len(writers)))
+        try:
+            for i, name, chunks in self._iter_pages(writers, row_field_idx, col_field_idx,
+                                                    max_rows, max_cols, max_tables, max_bytes,
+                                                    memory_budget, pool = pool):
+                outputs[i].write_page(writers[i].get_file_name(name), chunks)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for d, output in zip(outdirs, outputs):
+                if output is not d: # only close the outputs created here
+                    output.close()
+
+    def generate_pivots(self, outdir, writer, pivots = None, jobs = 1, max_rows = None,
+                        max_cols = None, max_tables = None, max_bytes = None,
+                        memory_budget = None):
+        """
+        Generate the pages of several row/column pivots in one call. The pages of each pivot are
+        written to their own subdirectory of ``outdir``, named ``<row_field>-<col_field>``.
+
+        Since all pages of a pivot show the same tables, only in different orders, the entries of
+        the tables of each pivot are collected in a single pass over :attr:`results` and shared by
+        all of its pages, rather than looked up again for every page. This keeps a copy of the
+        entries of all tables in memory; if ``memory_budget`` is smaller than the number of cells,
+        each page is generated within the budget as by :func:`generate_pages` instead.
+
+        :type outdir: str or :class:`outputs.Output`
+        :param outdir: The directory to write the subdirectories to, or the output to write the
+             pages to, in which case the file names of the pages are prefixed by
+             ``<row_field>-<col_field>/``.
+        :type writer: :class:`writers.Writer` (or its subclass) object
+        :param writer: The writer to be used.
+        :type pivots: sequence of (str, str)
+        :param pivots: A sequence of ``(row_field, col_field)`` pairs. If ``None``, all pairs of
+             distinct fields are generated, with the field that comes first in :attr:`names` as the
+             row field.
+        :type jobs: int
+        :param jobs: The number of pivots to generate concurrently, in threads. Rendering is pure
+             Python and is not sped up by threads, so this only overlaps the rendering with the
+             writing of the pages by the outputs (e.g., disk I/O or compression).
+        :param max_rows, max_cols, max_tables, max_bytes, memory_budget: The limits of the tables,
+             pages and memory. See :func:`generate_pages`.
+        :return: The list of the subdirectories (or prefixes) written to, in the same order as
+             ``pivots``.
+        :rtype: list of str
+        :raise TypeError: When ``writer`` is not an instance of :class:`writers.Writer`.
+        """
+
         from .writers import Writer
         if not isinstance(writer, Writer):
             raise TypeError('Invalid writer. Must be an instance of paramcomparison.writers.Writer')
 
-        try:
-            os.mkdir(outdir)
-        except:
-            pass
+        if pivots is None:
+            pivots = tuple(itertools.combinations(self.names, 2))
+        # validate all pivots before writing anything
+        for row_field, col_field in pivots:
+            self._field_index(row_field)
+            self._field_index(col_field)
 
-        prefix = outdir
-        if prefix[-1] != os.path.sep:
-            prefix += os.path.sep
+        from .outputs import Output, PrefixedOutput
+        if isinstance(outdir, Output):
+            dirs = ['{}-{}/'.format(r, c) for r, c in pivots]
+            tasks = [(PrefixedOutput(outdir, d), writer, r, c) for d, (r, c) in zip(dirs, pivots)]
+        else:
+            try:
+                os.mkdir(outdir)
+            except:
+                pass
+            dirs = [os.path.join(outdir, '{}-{}'.format(r, c)) for r, c in pivots]
+            tasks = [(d, writer, r, c) for d, (r, c) in zip(dirs, pivots)]
+        limits = (max_rows, max_cols, max_tables, max_bytes, memory_budget)
+        if jobs > 1 and len(tasks) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(jobs, len(tasks)))
+            try:
+                pool.map(lambda t: self._generate_pivot(*(t + limits)), tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for t in tasks:
+                self._generate_pivot(*(t + limits))
 
-        # the index of the row and column field
-        try:
-            row_field_idx = self.names.index(row_field)
-        except ValueError:
-            raise ValueError('Field "{}" does not exist'.format(row_field))
-        try:
-            col_field_idx = self.names.index(col_field)
-        except ValueError:
-            raise ValueError('Field "{}" does not exist'.format(col_field))
+        return dirs
 
-        if len(self.names) == 2: # we only have 2 fields, just generate a table
+    def _generate_pivot(self, outdir, writer, row_field, col_field, max_rows = None,
+                        max_cols = None, max_tables = None, max_bytes = None,
+                        memory_budget = None):
+        """
+        Generate the pages of a pivot, sharing the entries of its tables between the pages.
+
+        .. seealso:: :func:`generate_pivots` and :func:`generate_pages` for the parameters.
+        """
+
+        if self.metrics:
+            for m in self.metrics:
+                self.metric(m)._generate_pivot(_sub_outdir(outdir, m), writer, row_field,
+                                               col_field, max_rows, max_cols, max_tables,
+                                               max_bytes, memory_budget)
+            return
+
+        row_field_idx = self._field_index(row_field)
+        col_field_idx = self._field_index(col_field)
+        gathered = None
+        if len(self._page_fields(row_field_idx, col_field_idx)) > 1 and (
+                memory_budget is None or memory_budget >= len(self.results)):
+            gathered = self._gather_tables(row_field_idx, col_field_idx)
+        with self._open_output(outdir) as output:
+            for i, name, chunks in self._iter_pages((writer,), row_field_idx, col_field_idx,
+                                                    max_rows, max_cols, max_tables, max_bytes,
+                                                    memory_budget, gathered = gathered):
+                output.write_page(writer.get_file_name(name), chunks)
+
+    def aggregate(self, fields = None, key = float):
+        """
+        Compute the marginal statistics of the results: for each value of each field, the count,
+        min, max and mean of the results over all the other fields, as well as the parameters at
+        which the min and max are reached. All statistics are computed in a single pass over
+        :attr:`results`. Results which can't be converted by ``key`` (e.g., ``'never'`` when
+        ``key`` is ``float``) are skipped.
+
+        :type fields: sequence of str
+        :param fields: The fields to compute the statistics for. If ``None``, all fields.
+        :type key: function
+        :param key: The function converting a result string to a number.
+        :return: A dictionary ``{field: {value: {stat: ...}}}``, where ``stat`` is one of
+             ``'count'``, ``'min'``, ``'max'``, ``'mean'``, ``'argmin'`` and ``'argmax'``. The
+             ``'arg*'`` statistics are dictionaries of the parameters of the corresponding cell.
+             All statistics except ``'count'`` are ``None`` if no result can be converted.
+        :rtype: dict
+        :raise ValueError: When a field does not exist.
+        """
+
+        if fields is None:
+            fields = self.names
+        idxs = tuple(self._field_index(field) for field in fields)
+
+        # accumulators: [count, sum, min, max, argmin, argmax] for each value of each field
+        acc = tuple(dict() for i in idxs)
+        for k, r in six.iteritems(self.results):
+            try:
+                v = key(r)
+            except (TypeError, ValueError):
+                continue
+            for a, i in zip(acc, idxs):
+                s = a.get(k[i])
+                if s is None:
+                    a[k[i]] = [1, v, v, v, k, k]
+                    continue
+                s[0] += 1
+                s[1] += v
+                if v < s[2]:
+                    s[2] = v
+                    s[4] = k
+                if v > s[3]:
+                    s[3] = v
+                    s[5] = k
+
+        ret = dict()
+        for field, a, i in zip(fields, acc, idxs):
+            ret[field] = dict()
+            for value in self.grid[field]:
+                s = a.get(value)
+                if s is None:
+                    ret[field][value] = {'count': 0, 'min': None, 'max': None, 'mean': None,
+                                         'argmin': None, 'argmax': None}
+                    continue
+                ret[field][value] = {'count': s[0], 'min': s[2], 'max': s[3],
+                                     'mean': s[1] / float(s[0]),
+                                     'argmin': dict(zip(self.names, s[4])),
+                                     'argmax': dict(zip(self.names, s[5]))}
+        return ret
+
+    def best(self, key = float, maximize = False):
+        """
+        Find the best cell of all results.
+
+        :type key: function
+        :param key: The function converting a result string to a number. Results which can't be
+             converted are skipped.
+        :type maximize: bool
+        :param maximize: Whether the best cell is the maximum rather than the minimum.
+        :return: A tuple of the parameters (as a dict) and the result of the best cell, or ``None``
+             if no result can be converted.
+        :rtype: (dict, str)
+        """
+
+        found = None
+        found_v = None
+        for k, r in six.iteritems(self.results):
+            try:
+                v = key(r)
+            except (TypeError, ValueError):
+                continue
+            if found is None or (v > found_v if maximize else v < found_v):
+                found = k
+                found_v = v
+
+        if found is None:
+            return None
+        return dict(zip(self.names, found)), self.results[found]
+
+    def generate_aggregate_page(self, outdir, writer, fields = None,
+                                stats = ('min', 'max', 'mean', 'argmin'), key = float,
+                                name = 'aggregate', number_format = '{:g}'):
+        """
+        Generate a page of the marginal statistics computed by :func:`aggregate`. For each field,
+        a table is written whose rows are the values of the field and whose columns are ``stats``.
+        The page ends with a table listing the cells with the min and max results overall.
+
+        :type outdir: str or :class:`outputs.Output`
+        :param outdir: The directory to write the file to, or the output to write the page to.
+        :type writer: :class:`writers.Writer` (or its subclass) object
+        :param writer: The writer to be used.
+        :type fields: sequence of str
+        :param fields: See :func:`aggregate`.
+        :type stats: sequence of str
+        :param stats: The statistics to show as columns. See :func:`aggregate`.
+        :type key: function
+        :param key: See :func:`aggregate`.
+        :type name: str
+        :param name: The name of the page.
+        :type number_format: str
+        :param number_format: The format string for the numeric statistics.
+        :return: None
+        :raise TypeError: When ``writer`` is not an instance of :class:`writers.Writer`.
+        """
+
+        from .writers import Writer
+        if not isinstance(writer, Writer):
+            raise TypeError('Invalid writer. Must be an instance of paramcomparison.writers.Writer')
+
+        if fields is None:
+            fields = self.names
+        aggregates = self.aggregate(fields, key)
+
+        def format_stat(v, field):
+            if v is None:
+                return ''
+            if isinstance(v, dict): # the parameters of a cell
+                return ', '.join('{} = {}'.format(n, v[n]) for n in sorted(v) if n != field)
+            if isinstance(v, float):
+                return number_format.format(v)
+            return str(v)
+
+        def chunks():
+            yield writer.write_title(name)
+            for field in fields:
+                values = dict()
+                for value, s in six.iteritems(aggregates[field]):
+                    for stat in stats:
+                        values[(value, stat)] = format_stat(s[stat], field)
+                for chunk in writer.iter_table((field, 'statistic'), (None, None),
+                                               0, self.grid[field], 1, tuple(stats), values):
+                    yield chunk
+
+            yield writer.write_separator()
             values = dict()
-            params = [None, None]
-            for r in self.grid[row_field]:
-                params[row_field_idx] = r
-                for c in self.grid[col_field]:
-                    params[col_field_idx] = c
-                    values[(r, c)] = self.results[tuple(params)]
-            with open(prefix + writer.get_file_name('main'), 'w') as f:
-                f.write(writer.write_title('main'))
-                f.write(writer.write_table(self.names, (None, None),
-                                           row_field_idx, self.grid[row_field],
-                                           col_field_idx, self.grid[col_field], values))
+            for stat, maximize in (('min', False), ('max', True)):
+                found = self.best(key, maximize)
+                for n in self.names:
+                    values[(n, stat)] = found[0][n] if found else ''
+                values[('result', stat)] = found[1] if found else ''
+            for chunk in writer.iter_table(('field', 'best'), (None, None),
+                                           0, self.names + ('result',), 1, ('min', 'max'), values):
+                yield chunk
+            yield writer.write_footer()
+
+        with self._open_output(outdir) as output:
+            output.write_page(writer.get_file_name(name), chunks())
+
+    def leaderboard(self, k, key = float, maximize = False):
+        """
+        Find the ``k`` best cells of all results, without sorting all of them.
+
+        :type k: int
+        :param k: The number of cells.
+        :type key: function
+        :param key: The function converting a result string to a number. Results which can't be
+             converted are skipped.
+        :type maximize: bool
+        :param maximize: Whether the best cells are the largest rather than the smallest.
+        :return: A list of at most ``k`` tuples of the parameters (as a dict) and the result, the
+             best first.
+        :rtype: list of (dict, str)
+
+        .. seealso:: :func:`top_k`, which works on any iterable of cells.
+        """
+
+        return [(dict(zip(self.names, params)), result) for params, result in
+                top_k(six.iteritems(self.results), k, key, maximize)]
+
+    def generate_leaderboard_page(self, outdir, writer, k, key = float, maximize = False,
+                                  name = 'leaderboard'):
+        """
+        Generate a page with a table of the ``k`` best cells found by :func:`leaderboard`. Each
+        row of the table is a cell, ranked from 1, and the columns are the fields and the result.
+
+        :type outdir: str or :class:`outputs.Output`
+        :param outdir: The directory to write the file to, or the output to write the page to.
+        :type writer: :class:`writers.Writer` (or its subclass) object
+        :param writer: The writer to be used.
+        :type name: str
+        :param name: The name of the page.
+        :return: None
+        :raise TypeError: When ``writer`` is not an instance of :class:`writers.Writer`.
+
+        .. seealso:: :func:`leaderboard` for the other parameters.
+        """
+
+        from .writers import Writer
+        if not isinstance(writer, Writer):
+            raise TypeError('Invalid writer. Must be an instance of paramcomparison.writers.Writer')
+
+        board = self.leaderboard(k, key, maximize)
+        with self._open_output(outdir) as output:
+            output.write_page(writer.get_file_name(name),
+                              itertools.chain((writer.write_title(name),),
+                                              write_leaderboard(writer, board, self.names),
+                                              (writer.write_footer(),)))
+
+    def diff(self, other, tolerance = 0, key = float):
+        """
+        Compare the results with those of another object with the same fields, e.g., a run of a
+        new version against a baseline, in a single pass over both result stores. The cells are
+        aligned by the values of their fields, so the order of the fields and the values in the
+        grids may differ.
+
+        :type other: :class:`ParamComparison`
+        :param other: The object to compare with (the new results).
+        :type tolerance: float
+        :param tolerance: Results which differ as strings are still equal if both can be converted
+             by ``key`` and the converted values differ by at most ``tolerance``.
+        :type key: function
+        :param key: The function converting a result string to a number.
+        :return: A dict with the keys ``'changed'``, a list of ``(key, old, new)`` of the cells
+             whose results differ; ``'added'``, a list of the keys of the cells only ``other`` has;
+             and ``'removed'``, a list of the keys of the cells only this object has. All keys are
+             in the order of :attr:`names`. Cells not evaluated on both sides are ignored.
+        :rtype: dict
+        :raise ValueError: When the fields of ``other`` differ.
+        """
+
+        if sorted(self.names) != sorted(other.names):
+            raise ValueError('The fields of the two objects differ')
+
+        # align the keys of other to the order of our fields
+        perm = tuple(other.name_idx[n] for n in self.names)
+        other_results = dict((tuple(k[i] for i in perm), v)
+                             for k, v in six.iteritems(other.results) if v is not None)
+
+        changed = []
+        removed = []
+        for k, v in six.iteritems(self.results):
+            if v is None:
+                continue
+            w = other_results.pop(k, None)
+            if w is None:
+                removed.append(k)
+            elif v != w:
+                try:
+                    if abs(key(v) - key(w)) <= tolerance:
+                        continue
+                except (TypeError, ValueError):
+                    pass
+                changed.append((k, v, w))
+        added = list(other_results) # the cells left are not in this object
+
+        return {'changed': changed, 'added': added, 'removed': removed}
+
+    def generate_diff_pages(self, other, outdir, writer, row_field, col_field, tolerance = 0,
+                            key = float, missing = '(none)'):
+        """
+        Generate pages showing the differences from another object, as found by :func:`diff`. The
+        grid of the pages is the union of both grids, and only the tables which contain
+        differences are written. Each entry which differs shows both results as ``old -> new``, and
+        the other entries are empty.
+
+        :type other: :class:`ParamComparison`
+        :param other: See :func:`diff`.
+        :type missing: str
+        :param missing: The text standing for the result of a cell which is only on one side.
+        :return: What :func:`diff` returns.
+        :rtype: dict
+
+        .. seealso:: :func:`diff` for ``tolerance`` and ``key``, and :func:`generate_pages` for the
+             other parameters.
+        """
+
+        from .writers import Writer
+        if not isinstance(writer, Writer):
+            raise TypeError('Invalid writer. Must be an instance of paramcomparison.writers.Writer')
+
+        differences = self.diff(other, tolerance, key)
+
+        grid = collections.OrderedDict()
+        for n in self.names:
+            grid[n] = self.grid[n] + tuple(v for v in other.grid[n] if v not in self.grid[n])
+        results = dict((k, '') for k, v in six.iteritems(self.results) if v is not None)
+        for k, v, w in differences['changed']:
+            results[k] = '{} -> {}'.format(v, w)
+        for k in differences['removed']:
+            results[k] = '{} -> {}'.format(self.results[k], missing)
+        perm = tuple(self.name_idx[n] for n in other.names)
+        for k in differences['added']:
+            results[k] = '{} -> {}'.format(missing, other.results[tuple(k[i] for i in perm)])
+        pc = ParamComparison.from_results(grid, results)
+
+        row_field_idx = pc._field_index(row_field)
+        col_field_idx = pc._field_index(col_field)
+        with self._open_output(outdir) as output:
+            for i, name, chunks in pc._iter_pages((writer,), row_field_idx, col_field_idx,
+                                                  table_filter = _has_difference):
+                output.write_page(writer.get_file_name(name), chunks)
+
+        return differences
+
+    def _open_output(self, outdir):
+        """
+        :type outdir: str or :class:`outputs.Output`
+        :param outdir: A directory or an output.
+        :return: A context manager which gives the output to write pages to: ``outdir`` itself if it
+             is an output, which is left open; otherwise a :class:`outputs.DirectoryOutput` of the
+             directory, which is closed on exit.
+        """
+
+        from .outputs import Output, DirectoryOutput
+        if isinstance(outdir, Output):
+            return _NonClosingOutput(outdir)
+        return DirectoryOutput(outdir)
+
+    def _field_index(self, field):
+        """
+        :return: The index of ``field`` in :attr:`names`.
+        :raise ValueError: When ``field`` does not exist.
+        """
+
+        try:
+            return self.name_idx[field]
+        except KeyError:
+            raise ValueError('Field "{}" does not exist'.format(field))
+
+    def _table_values(self, params, row_idx, col_idx):
+        """
+        Collect the entries of a table.
+
+        :type params: sequence
+        :param params: The values of all fields. The values at ``row_idx`` and ``col_idx`` are
+             ignored.
+        :return: A dictionary as the ``values`` parameter of :func:`writers.Writer.write_table`.
+        :rtype: dict: (str, str) -> str
+        """
+
+        key = list(params)
+        results = self.results
+        col_values = self.grid[self.names[col_idx]]
+        values = dict()
+        for r in self.grid[self.names[row_idx]]:
+            key[row_idx] = r
+            for c in col_values:
+                key[col_idx] = c
+                values[(r, c)] = results[tuple(key)]
+        return values
+
+    def _gather_tables(self, row_idx, col_idx):
+        """
+        Collect the entries of all tables of a pivot in a single sequential pass over
+        :attr:`results`, so that they can be shared by all pages of the pivot. Cells missing in the
+        store are ``None``.
+
+        :return: A dictionary from the values of the fields other than the row and column fields
+             (in the order of :attr:`names`) to the entries of the table, as returned by
+             :func:`_table_values`.
+        :rtype: dict: tuple -> dict
+        """
+
+        cells = tuple(itertools.product(self.grid[self.names[row_idx]],
+                                        self.grid[self.names[col_idx]]))
+        others = tuple(j for j in range(len(self.names)) if j != row_idx and j != col_idx)
+        tables = dict()
+        for k, v in six.iteritems(self.results):
+            table = tuple(k[j] for j in others)
+            values = tables.get(table)
+            if values is None:
+                values = tables[table] = dict.fromkeys(cells)
+            values[(k[row_idx], k[col_idx])] = v
+        return tables
+
+    def _iter_table_values(self, tables, row_idx, col_idx, memory_budget = None, gathered = None):
+        """
+        Collect the entries of tables.
+
+        If ``gathered`` is given, the entries of each table are taken from it. Otherwise, without
+        ``memory_budget``, the entries of each table are looked up in :attr:`results`
+        directly. Otherwise, :attr:`results` is read sequentially, without looking any cell up,
+        which suits result stores kept on disk (any mapping can be assigned to :attr:`results`),
+        where sequential reads are much faster than random ones. A window of as many tables as fit
+        in ``memory_budget`` cells is filled while reading, and each table leaves the window as
+        soon as all of its cells have been read and the tables before it have left, which makes
+        room for the next table. When the tables of a page are laid out in the store in about the
+        order they are written (e.g., when the row and column fields are the last fields in
+        :attr:`names`), the store is read once per page. Otherwise, the tables which have joined
+        the window after some of their cells were passed are completed by reading the store again.
+        Cells missing in the store are ``None``.
+
+        :type tables: iterable of (block, params)
+        :param tables: The tables, as generated by :func:`_iter_tables`.
+        :type memory_budget: int
+        :param memory_budget: The maximum number of cells to keep in memory, or ``None``.
+        :type gathered: dict
+        :param gathered: The entries of all tables, as returned by :func:`_gather_tables`.
+        :return: A generator of ``(block, params, values)``, where ``values`` is as returned by
+             :func:`_table_values`.
+        """
+
+        row_values = self.grid[self.names[row_idx]]
+        col_values = self.grid[self.names[col_idx]]
+        # the fields identifying a table
+        others = tuple(j for j in range(len(self.names)) if j != row_idx and j != col_idx)
+
+        if gathered is not None:
+            for block, params in tables:
+                values = gathered.get(tuple(params[j] for j in others))
+                if values is None: # no cell of the table is in the store
+                    values = dict.fromkeys(itertools.product(row_values, col_values))
+                yield block, params, values
+            return
+
+        if memory_budget is None:
+            for block, params in tables:
+                yield block, params, self._table_values(params, row_idx, col_idx)
+            return
+
+        table_size = len(row_values) * len(col_values)
+        capacity = max(1, memory_budget // max(1, table_size))
+
+        tables = iter(tables)
+        # table -> [block, params, values, number of cells read, whether it has been in the window
+        # since the start of the current pass]
+        window = collections.OrderedDict()
+
+        def refill(whole_pass):
+            while len(window) < capacity:
+                table = next(tables, None)
+                if table is None:
+                    return
+                block, params = table
+                window[tuple(params[j] for j in others)] = [
+                    block, params, dict.fromkeys(itertools.product(row_values, col_values),
+                                                 _UNREAD), 0, whole_pass]
+
+        def pop_head():
+            block, params, values = window.popitem(last = False)[1][:3]
+            return block, params, values
+
+        refill(True)
+        while window:
+            for k, v in six.iteritems(self.results):
+                entry = window.get(tuple(k[j] for j in others))
+                if entry is None:
+                    continue
+                values = entry[2]
+                cell = (k[row_idx], k[col_idx])
+                if values[cell] is _UNREAD:
+                    entry[3] += 1
+                values[cell] = v
+                # tables leave the window in order, as soon as all of their cells have been read
+                while window and next(six.itervalues(window))[3] == table_size:
+                    yield pop_head()
+                    refill(False)
+            # the tables which have been in the window during the whole pass are complete
+            while window and next(six.itervalues(window))[4]:
+                block, params, values = pop_head()
+                for cell, v in six.iteritems(values):
+                    if v is _UNREAD:
+                        values[cell] = None
+                yield block, params, values
+            for entry in six.itervalues(window):
+                entry[4] = True
+            refill(True)
+
+    def _iter_tables(self, row_idx, col_idx, page_idx):
+        """
+        Iterate over the tables of one page in the order they are written.
+
+        :type page_idx: int
+        :param page_idx: The index of the comparison field of the page, which is iterated in the
+             innermost level. ``None`` if there are only 2 fields.
+        :return: A generator of ``(block, params)``, where ``block`` is the index of the block
+             separated by :func:`writers.Writer.write_separator`, and ``params`` is a tuple of the
+             values of all fields with ``None`` at ``row_idx`` and ``col_idx``.
+        """
+
+        if page_idx is None:
+            yield 0, (None, None)
             return
 
-        # i is the 3rd field
-        for i in range(len(self.names)):
+        # all fields except the row, column and comparison field
+        others = tuple(j for j in range(len(self.names)) if j not in (row_idx, col_idx, page_idx))
+        params = [None] * len(self.names)
+        for block, x in enumerate(itertools.product(*(self.grid[self.names[j]] for j in others))):
+            for j, v in zip(others, x):
+                params[j] = v
+            for v in self.grid[self.names[page_idx]]:
+                params[page_idx] = v
+                yield block, tuple(params)
+
+    def _iter_pages(self, writers, row_idx, col_idx, max_rows = None, max_cols = None,
+                    max_tables = None, max_bytes = None, memory_budget = None,
+                    table_filter = None, pool = None, gathered = None):
+        """
+        Iterate over the pages rendered by each writer, collecting the entries of each table once
+        for all writers. A page rendered by a single writer is streamed unless it may be split;
+        otherwise, each writer keeps the page (or the part of the page) it is rendering in memory
+        until it is complete.
+
+        :type writers: sequence of :class:`writers.Writer`
+        :param writers: The writers.
+        :return: A generator of ``(i, name, chunks)``, where ``i`` is the index of the writer in
+             ``writers``, ``name`` is the name of the page (the comparison parameter name, unless
+             the page is split) and ``chunks`` is an iterable of strings which make up the page.
+
+        .. seealso:: :func:`generate_pages` for the limits, and :func:`_iter_shared_units` for
+             ``table_filter``, ``pool`` and ``gathered``.
+        """
+
+        for name, page_idx in self._page_fields(row_idx, col_idx):
+            tables = self._iter_shared_units(writers, row_idx, col_idx, page_idx, max_rows,
+                                             max_cols, memory_budget, table_filter, pool,
+                                             gathered)
+            if len(writers) == 1 and max_tables is None and max_bytes is None:
+                writer = writers[0]
+                units = (unit for table in tables for unit in table[0])
+                yield 0, name, _join_units(writer.write_title(name), units, writer.write_footer())
+                continue
+            splitters = [_PageSplitter(w, name, max_tables, max_bytes) for w in writers]
+            for table in tables:
+                for i, splitter, units in zip(itertools.count(), splitters, table):
+                    for is_table, chunks in units:
+                        for part_name, part in splitter.add(is_table, chunks):
+                            yield i, part_name, part
+            for i, splitter in enumerate(splitters):
+                for part_name, part in splitter.close():
+                    yield i, part_name, part
+
+    def _page_fields(self, row_idx, col_idx):
+        """
+        :return: The pages as ``(name, page_idx)``, where ``page_idx`` is the index of the
+             comparison field of the page, or ``None`` if there are only 2 fields.
+        """
+
+        if len(self.names) == 2: # we only have 2 fields, just generate a table
+            return (('main', None),)
+        # the index of the 3rd field of each page
+        return tuple((self.names[i], i) for i in range(len(self.names))
+                     if i != row_idx and i != col_idx)
+
+    def _iter_shared_units(self, writers, row_idx, col_idx, page_idx, max_rows = None,
+                           max_cols = None, memory_budget = None, table_filter = None,
+                           pool = None, gathered = None):
+        """
+        Render the tables of the page of the comparison field ``page_idx`` with several writers,
+        collecting the entries of each table once. Only one table is kept in memory at a time.
+        Tables with more than ``max_rows`` rows or ``max_cols`` columns are split into tiles. See
+        :func:`_iter_table_values` for ``memory_budget`` and ``gathered``.
+
+        :type table_filter: function
+        :param table_filter: If not ``None``, only the tables whose values it returns true for are
+             rendered.
+        :type pool: :class:`multiprocessing.pool.ThreadPool`
+        :param pool: If not ``None``, the pool rendering the writers concurrently.
+        :return: A generator of a list of the units of each table rendered by each writer, where
+             the units are ``(is_table, chunks)`` and ``chunks`` is a list of strings of either a
+             tile or a separator.
+        """
+
+        row_tiles = _split_values(self.grid[self.names[row_idx]], max_rows)
+        col_tiles = _split_values(self.grid[self.names[col_idx]], max_cols)
 
-            # i is the index of the 3rd field
-            if i == row_field_idx or i == col_field_idx:
+        last_block = None
+        for block, params, values in self._iter_table_values(
+                self._iter_tables(row_idx, col_idx, page_idx), row_idx, col_idx, memory_budget,
+                gathered):
+            if table_filter is not None and not table_filter(values):
                 continue
+            separate = last_block is not None and block != last_block
+            last_block = block
+
+            def render(writer):
+                return [(is_table, list(chunks)) for is_table, chunks in _table_units(
+                    writer, self.names, params, row_idx, row_tiles, col_idx, col_tiles, values,
+                    separate)]
+
+            yield (pool.map(render, writers) if pool is not None
+                   else [render(w) for w in writers])
+
+    def export(self, path, fmt = 'csv', compress = None, result_name = 'result'):
+        """
+        Export all results in long format, i.e., one row per combination of parameters with all
+        fields in :attr:`names` as columns, followed by the result column (or a column per metric
+        if there are :attr:`metrics`). The rows are streamed to the file, so the memory usage does
+        not depend on the number of results.
+
+        :type path: str
+        :param path: The file to write to.
+        :type fmt: str
+        :param fmt: The output format, either ``'csv'`` or ``'jsonl'`` (JSON Lines).
+        :type compress: bool
+        :param compress: Whether to compress the output with gzip. If ``None``, compress if and only
+             if ``path`` ends with ``.gz``.
+        :type result_name: str
+        :param result_name: The name of the result column. It is not used if there are
+             :attr:`metrics`.
+        :return: None
+        :raise ValueError: When ``fmt`` is not a supported format, or ``result_name`` conflicts with
+             a field name.
+        """
+
+        if fmt not in ('csv', 'jsonl'):
+            raise ValueError('Unsupported export format "{}"'.format(fmt))
+        result_names = self.metrics or (result_name,)
+        for name in result_names:
+            if name in self.name_idx:
+                raise ValueError('Result name "{}" conflicts with a field'.format(name))
+        if compress is None:
+            compress = path.endswith('.gz')
+
+        if compress:
+            import gzip
+            stream = gzip.open(path, 'wb')
+        else:
+            stream = open(path, 'wb')
+        if not six.PY2:
+            import io
+            stream = io.TextIOWrapper(stream, encoding = 'utf-8', newline = '')
+
+        columns = self.names + result_names
+        if self.metrics:
+            others = tuple(self.metric_results[m] for m in self.metrics[1:])
+            rows = (k + (v,) + tuple(c[k] for c in others) for k, v in six.iteritems(self.results))
+        else:
+            rows = (k + (v,) for k, v in six.iteritems(self.results))
+        with stream:
+            if fmt == 'csv':
+                import csv
+                w = csv.writer(stream)
+                w.writerow(columns)
+                w.writerows(rows)
+            else:
+                import json
+                stream.writelines(json.dumps(dict(zip(columns, row)), sort_keys = True) + '\n'
+                                  for row in rows)
+
+def _result_strings(result, metrics):
+    """
+    Convert a result returned by a reader to what is stored in the results.
+
+    :param result: The result, which is a dict of the metrics (or a single value shared by all
+         metrics, such as the timeout value) if ``metrics`` is not empty.
+    :type metrics: tuple of str
+    :param metrics: The names of the metrics.
+    :return: The result string, or a dict of the strings of the metrics if ``metrics`` is not
+         empty.
+    :raise KeyError: When a metric is missing from the result.
+    """
+
+    if not metrics:
+        return str(result)
+    if isinstance(result, dict):
+        return dict((m, str(result[m])) for m in metrics)
+    return dict.fromkeys(metrics, str(result))
+
+# the entry of a cell which has not been read yet, see ParamComparison._iter_table_values
+_UNREAD = object()
+
+def _split_values(values, size):
+    """
+    :return: ``values`` split into tuples of at most ``size`` elements. If ``size`` is ``None``,
+         ``values`` is not split.
+    """
+
+    if size is None:
+        return (values,)
+    return tuple(values[i:i + size] for i in range(0, len(values), size))
+
+def _table_units(writer, names, params, row_idx, row_tiles, col_idx, col_tiles, values, separate):
+    """
+    :type separate: bool
+    :param separate: Whether the table starts a new block, which is preceded by a separator.
+         Separators are only written between blocks, never at the end.
+    :return: A generator of the units ``(is_table, chunks)`` of a table: its tiles, preceded by a
+         separator if ``separate`` is true.
+    """
+
+    if separate:
+        yield False, (writer.write_separator(),)
+    for r in row_tiles:
+        for c in col_tiles:
+            yield True, writer.iter_table(names, params, row_idx, r, col_idx, c, values)
+
+def _sub_outdir(outdir, name):
+    """
+    :type outdir: str or :class:`outputs.Output`
+    :param outdir: A directory or an output.
+    :return: The subdirectory ``name`` of the directory ``outdir``, which is created if the
+         directory is, or an output relaying to ``outdir`` with ``<name>/`` as prefix.
+    """
+
+    from .outputs import Output, PrefixedOutput
+    if isinstance(outdir, Output):
+        return PrefixedOutput(outdir, name + '/')
+    try:
+        os.mkdir(outdir)
+    except:
+        pass
+    return os.path.join(outdir, name)
+
+def _join_units(title, units, footer):
+    """
+    :return: A generator of the strings of a page, given its title, units and footer.
+    """
+
+    yield title
+    for is_table, chunks in units:
+        for chunk in chunks:
+            yield chunk
+    yield footer
+
+class _PageSplitter(object):
+    """
+    Split a page into numbered pages named ``<name>-1``, ``<name>-2``, etc., each of which has at
+    most ``max_tables`` tables and at most about ``max_bytes`` characters (unless a single table is
+    larger), and an index page named ``name`` linking to them. If the page doesn't need to be
+    split, it is kept as is. The units of the page are added one by one, and the pages are returned
+    as soon as they are complete, so only one page is kept in memory at a time.
+    """
+
+    def __init__(self, writer, name, max_tables = None, max_bytes = None):
+        self.writer = writer
+        self.name = name
+        self.max_tables = max_tables
+        self.max_bytes = max_bytes
+        self.part = []
+        self.size = 0
+        self.tables = 0
+        self.separators = [] # separators are only kept if a table follows in the same part
+        self.first = None # the first part, kept until it is known whether the page is split
+        self.part_names = []
+
+    def _named(self, part):
+        part_name = '{}-{}'.format(self.name, len(self.part_names) + 1)
+        self.part_names.append(part_name)
+        return part_name, [self.writer.write_title(part_name)] + part + [self.writer.write_footer()]
+
+    def _end_part(self):
+        """
+        :return: The list of ``(name, chunks)`` of the pages completed by ending the current part.
+        """
+
+        part = self.part
+        self.part = []
+        self.size = 0
+        self.tables = 0
+        self.separators = []
+        if self.first is None and not self.part_names:
+            self.first = part
+            return []
+        pages = []
+        if self.first is not None:
+            pages.append(self._named(self.first))
+            self.first = None
+        pages.append(self._named(part))
+        return pages
+
+    def add(self, is_table, chunks):
+        """
+        Add a unit of the page.
+
+        :return: The list of ``(name, chunks)`` of the pages completed.
+        """
+
+        chunks = list(chunks)
+        if not is_table:
+            self.separators.extend(chunks)
+            return []
+        pages = []
+        table_size = sum(len(chunk) for chunk in chunks)
+        if self.tables and (
+                (self.max_tables is not None and self.tables >= self.max_tables) or
+                (self.max_bytes is not None and self.size + table_size > self.max_bytes)):
+            pages = self._end_part()
+        self.part.extend(self.separators)
+        self.part.extend(chunks)
+        self.size += table_size + sum(len(sep) for sep in self.separators)
+        self.tables += 1
+        self.separators = []
+        return pages
+
+    def close(self):
+        """
+        :return: The list of ``(name, chunks)`` of the remaining pages, the index page last.
+        """
+
+        if self.first is None and not self.part_names: # a single page is enough
+            return [(self.name, [self.writer.write_title(self.name)] + self.part +
+                     [self.writer.write_footer()])]
+        pages = self._end_part()
+        pages.append((self.name, (self.writer.write_title(self.name),
+                                  self.writer.write_index(self.part_names),
+                                  self.writer.write_footer())))
+        return pages
+
+def _has_difference(values):
+    """
+    :return: Whether the values of a table of differences contain any difference.
+    """
+
+    return any(six.itervalues(values))
+
+def _apply(pool, func, *args):
+    """
+    Call ``func`` with ``args`` in a worker of ``pool`` and wait for the result.
+    """
+    return pool.apply(func, args)
+
+def _group_cells(cells, idxs, names):
+    """
+    Group cells by the values of some fields, keeping the order of the first cell of each group and
+    the order of the cells within each group.
+
+    :type cells: iterable of (key, params)
+    :param cells: The cells, as passed to :func:`evaluation.evaluate`.
+    :type idxs: tuple of int
+    :param idxs: The indices of the fields to group by.
+    :type names: tuple of str
+    :param names: The names of all fields.
+    :return: A generator of ``(group_params, cells)``, where ``group_params`` is a dict of the
+         values of the fields shared by the group. If ``idxs`` is empty, all cells are generated
+         as a single group with ``None`` as ``group_params``.
+    """
+
+    if not idxs:
+        yield None, cells
+        return
+
+    groups = collections.OrderedDict()
+    for key, params in cells:
+        group = groups.setdefault(tuple(key[i] for i in idxs), [])
+        group.append((key, params))
+    for group in six.itervalues(groups):
+        params = group[0][1]
+        yield dict((names[i], params[names[i]]) for i in idxs), group
+
+def _dedup_cells(cells, reader, names, followers, done, ready):
+    """
+    Skip the cells whose result is shared with an earlier cell because they differ only in
+    parameters ignored by the reader (see :func:`readers.Reader.ignored_params`).
+
+    :type cells: iterable of (key, params)
+    :param cells: The cells, as passed to :func:`evaluation.evaluate`.
+    :type reader: :class:`readers.Reader`
+    :param reader: The reader.
+    :type names: tuple of str
+    :param names: The names of all fields.
+    :type followers: dict
+    :param followers: Updated with the keys of the skipped cells, indexed by the key of the cell
+         generated in their place, until that cell is removed once it is read.
+    :type done: dict
+    :param done: The results of the cells generated in place of others which have been read.
+    :type ready: list
+    :param ready: Extended with ``(key, result)`` of the skipped cells whose result is in ``done``.
+    :return: A generator of the cells to read.
+    """
+
+    representatives = {} # key with the ignored fields set to None -> key of the cell read
+    for key, params in cells:
+        ignored = reader.ignored_params(params)
+        if not ignored:
+            yield key, params
+            continue
+        ignored = frozenset(ignored)
+        reduced = tuple(None if n in ignored else v for n, v in zip(names, key))
+        representative = representatives.get(reduced)
+        if representative is None:
+            representatives[reduced] = key
+            followers[key] = []
+            yield key, params
+        elif representative in done:
+            ready.append((key, done[representative]))
+        else:
+            followers[representative].append(key)
+
+class _NonClosingOutput(object):
+    """
+    A context manager giving an output without closing it on exit.
+    """
+
+    def __init__(self, output):
+        self.output = output
+
+    def __enter__(self):
+        return self.output
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+def _iter_sample(is_pending, shape, seed = None):
+    """
+    Generate the index tuples of pending cells in a space-filling order. Each round draws a Latin
+    hypercube design over the index ranges in ``shape``, whose size is the largest range so that all
+    indices of all fields are covered; the pending cells in the design are generated. Once the
+    rounds stop finding pending cells, the rest are generated in a random order. Only the cells
+    generated so far are kept in memory until the last phase.
+
+    :type is_pending: function
+    :param is_pending: A function which tells whether the cell of an index tuple is pending.
+    :type shape: tuple of int
+    :param shape: The number of values of each field.
+    :type seed: int
+    :param seed: The seed of the random number generator.
+    """
+
+    import random
+
+    if 0 in shape: # no cells at all
+        return
+
+    rng = random.Random(seed)
+    size = max(shape) if shape else 1
+    generated = set()
+    misses = 0
+    while misses < 10:
+        columns = []
+        for n in shape:
+            column = [j * n // size for j in range(size)]
+            rng.shuffle(column)
+            columns.append(column)
+        found = False
+        for idx in zip(*columns):
+            if idx not in generated and is_pending(idx):
+                generated.add(idx)
+                found = True
+                yield idx
+        misses = 0 if found else misses + 1
+
+    rest = [idx for idx in itertools.product(*(range(n) for n in shape))
+            if idx not in generated and is_pending(idx)]
+    rng.shuffle(rest)
+    for idx in rest:
+        yield idx
+
+def top_k(cells, k, key = float, maximize = False):
+    """
+    Select the ``k`` best cells from an iterable of cells with a bounded heap, so that only ``k``
+    cells are kept in memory. This works on any iterable, including cells which are lazily evaluated
+    or read from shards.
+
+    :type cells: iterable of (params, str)
+    :param cells: The cells, each of which is a tuple of its parameters and its result.
+    :type k: int
+    :param k: The number of cells to select.
+    :type key: function
+    :param key: The function converting a result string to a number. Results which can't be
+         converted are skipped.
+    :type maximize: bool
+    :param maximize: Whether the best cells are the largest rather than the smallest.
+    :return: A list of at most ``k`` cells, the best first.
+    :rtype: list
+    """
+
+    import heapq
+
+    def converted():
+        for cell in cells:
+            try:
+                yield key(cell[1]), cell
+            except (TypeError, ValueError):
+                pass
+
+    select = heapq.nlargest if maximize else heapq.nsmallest
+    return [cell for v, cell in select(k, converted(), key = lambda x: x[0])]
+
+def write_leaderboard(writer, cells, names):
+    """
+    Write a ranked table of cells with a writer.
+
+    :type writer: :class:`writers.Writer` (or its subclass) object
+    :param writer: The writer to be used.
+    :type cells: sequence of (dict, str)
+    :param cells: The cells, each of which is a tuple of its parameters and its result.
+    :type names: sequence of str
+    :param names: The fields to be shown as columns, before the result column.
+    :return: A generator of strings which make up the table. Nothing is generated if ``cells`` is
+         empty.
+    """
+
+    if not cells:
+        return iter(())
 
-            with open(prefix + writer.get_file_name(self.names[i]), 'w') as f:
-
-                # write title first
-                f.write(writer.write_title(self.names[i]))
-
-                # subgrid with i, row_field_idx and col_field_idx removed
-                subgrid = copy.deepcopy(self.grid)
-                for j in (i, row_field_idx, col_field_idx):
-                    subgrid.pop(self.names[j])
-
-                # Iterate all fields except row_field and col_field. Field i is always iterated in
-                # the last level. List the tables of the row field and column field for them.
-                num_iterable = sum(1 for x in itertools.product(*subgrid.values()))
-                x_idx = 0
-                for x in itertools.product(*subgrid.values()):
-                    x_idx += 1
-                    params = [None for j in range(len(self.names))]
-                    subgrid_keys = tuple(subgrid.keys())
-                    for j in range(len(subgrid_keys)):
-                        params[self.name_idx[subgrid_keys[j]]] = x[j]
-                    for v in self.grid[self.names[i]]:
-                        params[i] = v
-                        # a dictionary for only row and column fields
-                        values = dict()
-                        for r in self.grid[row_field]:
-                            params[row_field_idx] = r
-                            for c in self.grid[col_field]:
-                                params[col_field_idx] = c
-                                values[(r, c)] = self.results[tuple(params)]
-
-                        params[row_field_idx] = None
-                        params[col_field_idx] = None
-                        f.write(writer.write_table(self.names, tuple(params),
-                                                   row_field_idx, self.grid[row_field],
-                                                   col_field_idx, self.grid[col_field],
-                                                   values))
-
-                    # don't write the separator for the last section
-                    if x_idx < num_iterable:
-                        f.write(writer.write_separator())
+    ranks = tuple(str(i + 1) for i in range(len(cells)))
+    columns = tuple(names) + ('result',)
+    values = dict()
+    for rank, (params, result) in zip(ranks, cells):
+        for n in names:
+            values[(rank, n)] = str(params[n])
+        values[(rank, 'result')] = str(result)
+    return writer.iter_table(('rank', 'field'), (None, None), 0, ranks, 1, columns, values)
@@ -0,0 +1,268 @@
+# Copyright (c) 2015 Hong Xu <hong@topbug.net>
+
+# This file is part of ParamComparison.
+
+# ParamComparison is free software: you can redistribute it and/or modify it under the terms of the
+# GNU Lesser General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+
+# ParamComparison is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License along with
+# ParamComparison. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The command line interface. A sweep is described by a spec file in JSON or TOML format, e.g.:
+::
+
+    {
+        "grid": {
+            "theta": [0.52, 1.05],
+            "mu": {"linspace": [0.1, 1.0, 4]},
+            "g": {"logspace": [0, 1, 3]},
+            "h": {"range": [1, 4]}
+        },
+        "reader": "mymodule:compute",
+        "data": null,
+        "row": "theta",
+        "col": "mu"
+    }
+
+``grid`` maps each field to either a list of values or a range generator: ``linspace`` (``[start,
+stop, num]``), ``logspace`` (``[start, stop, num]``, base 10) or ``range`` (``[stop]``, ``[start,
+stop]`` or ``[start, stop, step]``, as the builtin ``range``). ``reader`` is the import path of
+either a :class:`readers.Reader` instance or subclass, or a function, which is wrapped by
+:class:`readers.UserFunctionReader` with ``data`` as its data. The directory of the spec file is
+searched first when importing the reader.
+
+Only the modules required by the selected options are imported, to keep the startup fast.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+OUTPUT_FORMATS = ('rst', 'html', 'csv', 'jsonl')
+
+def _round(x):
+    """
+    Round away floating point noise, such that e.g. 0.1 + 0.2 gives 0.3.
+    """
+    return float('{:.12g}'.format(x))
+
+def linspace(start, stop, num):
+    """
+    Lazily generate ``num`` evenly spaced numbers from ``start`` to ``stop``, inclusive.
+
+    :rtype: generator of float
+    """
+
+    if num == 1:
+        yield _round(start)
+        return
+    step = (stop - start) / float(num - 1)
+    for i in range(num):
+        yield _round(start + i * step)
+
+def logspace(start, stop, num, base = 10):
+    """
+    Lazily generate ``num`` numbers evenly spaced on a log scale from ``base ** start`` to ``base **
+    stop``, inclusive.
+
+    :rtype: generator of float
+    """
+
+    for x in linspace(start, stop, num):
+        yield _round(base ** x)
+
+RANGE_GENERATORS = {'linspace': linspace, 'logspace': logspace, 'range': range}
+
+def parse_grid(spec):
+    """
+    Parse the grid in a spec.
+
+    :type spec: dict: str -> list or dict
+    :param spec: The ``grid`` item of a spec.
+    :return: The grid to be passed to :class:`ParamComparison`, whose values are lazy iterables.
+    :rtype: dict
+    :raise ValueError: When an axis is invalid.
+    """
+
+    grid = dict()
+    for name, axis in spec.items():
+        if isinstance(axis, dict):
+            if len(axis) != 1 or list(axis)[0] not in RANGE_GENERATORS:
+                raise ValueError('Invalid range of field "{}". Must be one of: {}'.format(
+                    name, ', '.join(sorted(RANGE_GENERATORS))))
+            gen, args = list(axis.items())[0]
+            grid[name] = RANGE_GENERATORS[gen](*args)
+        elif isinstance(axis, list):
+            grid[name] = axis
+        else:
+            raise ValueError('Invalid values of field "{}"'.format(name))
+    return grid
+
+def load_spec(path):
+    """
+    Load a spec file. Files ending with ``.toml`` are parsed as TOML, others as JSON.
+
+    :rtype: dict
+    """
+
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+            with open(path, 'rb') as f:
+                return tomllib.load(f)
+        except ImportError: # python < 3.11
+            import toml
+            with open(path) as f:
+                return toml.load(f)
+
+    import json
+    with open(path) as f:
+        return json.load(f)
+
+def import_object(path):
+    """
+    Import an object given its path, in the form of ``module:attr`` or ``module.attr``.
+    """
+
+    import importlib
+
+    if ':' in path:
+        module, attr = path.split(':', 1)
+    else:
+        module, attr = path.rsplit('.', 1)
+    obj = importlib.import_module(module)
+    for a in attr.split('.'):
+        obj = getattr(obj, a)
+    return obj
+
+def make_reader(obj, data, cache_size = None):
+    """
+    Make a reader from an imported object.
+
+    :type cache_size: int
+    :param cache_size: The number of results to memoize if ``obj`` is a function. See
+         :class:`readers.UserFunctionReader`.
+
+    :raise TypeError: When ``obj`` is neither a reader nor a function.
+    """
+
+    from .readers import Reader, UserFunctionReader
+
+    if isinstance(obj, Reader):
+        return obj
+    if isinstance(obj, type) and issubclass(obj, Reader):
+        return obj()
+    if callable(obj):
+        return UserFunctionReader(obj, data, cache_size)
+    raise TypeError('Invalid reader. Must be a Reader instance or subclass, or a function')
+
+def make_parser():
+    """
+    :rtype: argparse.ArgumentParser
+    """
+
+    parser = argparse.ArgumentParser(prog = 'paramcomparison',
+                                     description = 'Parameter Comparison Table Generator')
+    parser.add_argument('spec', help = 'the spec file in JSON or TOML format')
+    parser.add_argument('-o', '--output', default = 'output',
+                        help = 'the output directory, or an archive if it ends with .zip, .tar.gz '
+                        'or .tgz (default: %(default)s)')
+    parser.add_argument('-f', '--format', default = 'rst', choices = OUTPUT_FORMATS,
+                        help = 'the output format (default: %(default)s)')
+    parser.add_argument('-r', '--row', help = 'the row field, overriding the spec')
+    parser.add_argument('-c', '--col', help = 'the column field, overriding the spec')
+    parser.add_argument('--all-pivots', action = 'store_true',
+                        help = 'generate the pages of all pairs of row and column fields')
+    parser.add_argument('-j', '--jobs', type = int, default = 1,
+                        help = 'the number of cells to evaluate and pivots to render concurrently '
+                        '(default: %(default)s)')
+    parser.add_argument('-p', '--processes', action = 'store_true',
+                        help = 'evaluate cells in worker processes rather than threads')
+    parser.add_argument('-t', '--timeout', type = float,
+                        help = 'the deadline in seconds of evaluating each cell')
+    parser.add_argument('-b', '--budget', type = int,
+                        help = 'only evaluate a space-filling sample of this many cells')
+    parser.add_argument('--time-budget', type = float,
+                        help = 'only evaluate a space-filling sample of cells for this many seconds')
+    parser.add_argument('--cache-size', type = int,
+                        help = 'the number of results of a reader function to memoize')
+    for limit, help_text in (('rows', 'split tables into tiles of at most this many rows'),
+                             ('cols', 'split tables into tiles of at most this many columns'),
+                             ('tables', 'split pages into pages of at most this many tables'),
+                             ('bytes', 'split pages into pages of at most about this many bytes')):
+        parser.add_argument('--max-' + limit, type = int, help = help_text)
+    parser.add_argument('--memory-budget', type = int,
+                        help = 'read the results sequentially in chunks of at most this many cells')
+    parser.add_argument('-z', '--compress', action = 'store_true',
+                        help = 'compress the csv or jsonl output with gzip')
+    return parser
+
+def main(argv = None):
+    """
+    The entry point of the command line interface.
+
+    :type argv: list of str
+    :param argv: The command line arguments, excluding the program name. If ``None``,
+         ``sys.argv[1:]`` is used.
+    :return: The exit status.
+    :rtype: int
+    """
+
+    parser = make_parser()
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    for key in ('grid', 'reader'):
+        if key not in spec:
+            parser.error('"{}" is missing in the spec'.format(key))
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.spec)))
+    try:
+        reader = make_reader(import_object(spec['reader']), spec.get('data'), args.cache_size)
+    finally:
+        sys.path.pop(0)
+
+    from . import ParamComparison
+    pc = ParamComparison(parse_grid(spec['grid']), reader, jobs = args.jobs,
+                         timeout = args.timeout, budget = args.budget,
+                         time_budget = args.time_budget, processes = args.processes)
+
+    if args.format in ('csv', 'jsonl'):
+        try:
+            os.mkdir(args.output)
+        except OSError:
+            pass
+        name = 'results.' + args.format + ('.gz' if args.compress else '')
+        pc.export(os.path.join(args.output, name), args.format)
+        return 0
+
+    from .writers import RstWriter, HtmlWriter
+    writer = RstWriter() if args.format == 'rst' else HtmlWriter()
+    row = args.row or spec.get('row')
+    col = args.col or spec.get('col')
+    if not args.all_pivots and (row is None or col is None):
+        parser.error('The row and column fields must be given unless --all-pivots is set')
+
+    output = args.output
+    if output.endswith('.zip') or output.endswith('.tar.gz') or output.endswith('.tgz'):
+        from .outputs import ArchiveOutput
+        output = ArchiveOutput(output)
+    try:
+        limits = (args.max_rows, args.max_cols, args.max_tables, args.max_bytes,
+                  args.memory_budget)
+        if args.all_pivots:
+            pc.generate_pivots(output, writer, None, args.jobs, *limits)
+        else:
+            pc.generate_pages(output, writer, row, col, *limits)
+    finally:
+        if output is not args.output:
+            output.close()
+    return 0
@@ -0,0 +1,289 @@
+# Copyright (c) 2015 Hong Xu <hong@topbug.net>
+
+# This file is part of ParamComparison.
+
+# ParamComparison is free software: you can redistribute it and/or modify it under the terms of the
+# GNU Lesser General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+
+# ParamComparison is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License along with
+# ParamComparison. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Evaluation of the cells of a grid, optionally in parallel and with per-cell deadlines.
+"""
+
+from __future__ import print_function
+
+import math
+import sys
+import threading
+import time
+
+import six
+from six.moves import queue
+
+def evaluate(read, cells, jobs = 1, timeout = None, timeout_value = 'timeout',
+             speculate_after = None, cost = None, timings = None):
+    """
+    Evaluate cells and generate the results in the order the cells are completed.
+
+    When ``jobs`` is 1 and there is no ``timeout``, the cells are simply evaluated one after another
+    in the calling thread. Otherwise, they are evaluated by ``jobs`` worker threads. A cell which
+    has not completed within ``timeout`` seconds is given up: ``timeout_value`` is generated as its
+    result and its worker thread is abandoned (threads can't be killed) and replaced by a new one,
+    so a hanging cell never delays the rest of the grid by more than ``timeout``.
+
+    Once the fraction of completed cells reaches ``speculate_after`` and no cells are waiting to be
+    started, idle workers speculatively re-execute the cells which have been running the longest
+    (each at most once). Whichever execution completes first wins; this reduces the delay caused by
+    stragglers which are slow for transient reasons. ``read`` must therefore be safe to call more
+    than once with the same parameters.
+
+    If ``cost`` is given, the worker threads start the cells in decreasing order of their estimated
+    cost (longest processing time first), so that expensive cells don't start last and keep the
+    other workers idle at the end. Since each idle worker takes the next cell as soon as it is
+    free, the cheap cells fill in around the expensive ones.
+
+    When the generator is closed (or ``read`` raises an exception), the cells which have not been
+    started are skipped, and the cells being evaluated are waited for (at most ``timeout`` seconds),
+    so that no cell is evaluated once the generator has returned. Only the executions of cells
+    which have already been given up or completed by another execution are not waited for.
+
+    :type read: function
+    :param read: The function evaluating a cell, such as :func:`readers.Reader.read`.
+    :type cells: iterable of (key, params)
+    :param cells: The cells to evaluate. ``params`` is passed to ``read``, and ``key`` is generated
+         with the result.
+    :type jobs: int
+    :param jobs: The number of worker threads.
+    :type timeout: float
+    :param timeout: The deadline of each cell in seconds, counted from the start of its first
+         execution. ``None`` means no deadline.
+    :param timeout_value: The result of cells which exceed the deadline.
+    :type speculate_after: float
+    :param speculate_after: The fraction of completed cells (between 0 and 1) after which stragglers
+         are re-executed. ``None`` disables speculative re-execution.
+    :type cost: function
+    :param cost: If not ``None``, a function estimating the cost of a cell, called with ``key``
+         and ``params``. It is not used when the cells are evaluated one after another.
+    :type timings: dict
+    :param timings: If not ``None``, updated with the time in seconds each cell has taken, indexed
+         by ``key``. The time of a cell exceeding the deadline is the time it was given up after.
+    :return: A generator of ``(key, result)``.
+    :raise: Any exception raised by ``read``, after which no more results are generated.
+    """
+
+    if jobs <= 1 and timeout is None:
+        for key, params in cells:
+            start = time.time()
+            result = read(params)
+            if timings is not None:
+                timings[key] = time.time() - start
+            yield key, result
+        return
+
+    cells = list(cells)
+    tasks = queue.Queue()
+    done = queue.Queue()
+    lock = threading.Lock()
+    state = {'waiting': 0, # number of workers waiting for a task
+             'stopped': False} # whether the remaining tasks are skipped
+    running = dict() # index -> start time of the first execution
+    current = dict() # worker thread -> index of the cell it is evaluating
+    finished = set()
+    speculated = set()
+
+    def worker():
+        while True:
+            with lock:
+                state['waiting'] += 1
+            i = tasks.get()
+            with lock:
+                state['waiting'] -= 1
+                if i is None or state['stopped']:
+                    return
+                if i in finished: # completed by another execution meanwhile
+                    continue
+                running.setdefault(i, time.time())
+                current[threading.current_thread()] = i
+            start = time.time()
+            try:
+                done.put((i, read(cells[i][1]), None, time.time() - start))
+            except Exception:
+                done.put((i, None, sys.exc_info(), None))
+            with lock:
+                del current[threading.current_thread()]
+
+    threads = []
+    def start_worker():
+        t = threading.Thread(target = worker)
+        t.daemon = True # don't let an abandoned worker block the exit of the interpreter
+        t.start()
+        threads.append(t)
+
+    order = range(len(cells))
+    if cost is not None:
+        order = sorted(order, key = lambda i: cost(*cells[i]), reverse = True)
+    for i in order:
+        tasks.put(i)
+    for i in range(jobs):
+        start_worker()
+
+    remaining = len(cells)
+    try:
+        while remaining:
+            # how long to wait for the next completion
+            wait = None
+            if timeout is not None:
+                with lock:
+                    starts = tuple(running.values())
+                wait = max(0, min(starts) + timeout - time.time()) if starts else 0.01
+            if speculate_after is not None and \
+               len(cells) - remaining >= speculate_after * len(cells):
+                wait = 0.01 if wait is None else min(wait, 0.01)
+
+            try:
+                i, result, exc_info, elapsed = done.get(timeout = wait)
+            except queue.Empty:
+                pass
+            else:
+                with lock:
+                    if i in finished:
+                        continue
+                    finished.add(i)
+                    running.pop(i, None)
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                if timings is not None:
+                    timings[cells[i][0]] = elapsed
+                remaining -= 1
+                yield cells[i][0], result
+                continue
+
+            if timeout is not None:
+                now = time.time()
+                with lock:
+                    expired = [i for i, start in running.items() if start + timeout <= now]
+                    for i in expired:
+                        finished.add(i)
+                        running.pop(i)
+                for i in expired:
+                    if timings is not None:
+                        timings[cells[i][0]] = timeout
+                    remaining -= 1
+                    start_worker() # replace the worker stuck in the expired cell
+                    yield cells[i][0], timeout_value
+
+            if speculate_after is not None and tasks.empty():
+                with lock:
+                    stragglers = sorted((i for i in running if i not in speculated),
+                                        key = lambda i: running[i])[:state['waiting']]
+                    speculated.update(stragglers)
+                for i in stragglers:
+                    tasks.put(i)
+    finally:
+        # stop all workers, including the abandoned ones once they return
+        with lock:
+            state['stopped'] = True
+        for t in threads:
+            tasks.put(None)
+        # wait for the cells being evaluated
+        with lock:
+            busy = [t for t in threads if current.get(t) not in finished]
+        deadline = None if timeout is None else time.time() + timeout
+        for t in busy:
+            t.join(None if deadline is None else max(0, deadline - time.time()))
+
+def cost_model(timings):
+    """
+    Learn a model of the costs of cells from the times recorded in a previous run, e.g.,
+    :attr:`ParamComparison.timings`, to be used as the ``cost`` of :func:`evaluate`. The logarithm
+    of the cost is modeled as the sum of the effects of the values of each field, estimated as the
+    mean logarithm of the times of the cells with the value, relative to the mean of all. The cells
+    whose time has been recorded are estimated by that time.
+
+    :type timings: dict: tuple -> float
+    :param timings: The times in seconds, indexed by the keys of the cells.
+    :return: A function estimating the cost of a cell, called with its key.
+    """
+
+    logs = [(k, math.log(max(t, 1e-6))) for k, t in six.iteritems(timings)]
+    mean = sum(l for k, l in logs) / len(logs) if logs else 0.0
+    sums = [] # for each field: value -> [sum of logarithms, count]
+    for k, l in logs:
+        while len(sums) < len(k):
+            sums.append(dict())
+        for s, v in zip(sums, k):
+            acc = s.setdefault(v, [0.0, 0])
+            acc[0] += l
+            acc[1] += 1
+    effects = [dict((v, acc[0] / acc[1] - mean) for v, acc in six.iteritems(s)) for s in sums]
+
+    def estimate(key):
+        t = timings.get(key)
+        if t is not None:
+            return t
+        return math.exp(mean + sum(e.get(v, 0.0) for e, v in zip(effects, key)))
+
+    return estimate
+
+# the state of a worker process
+_worker_reader = None
+_worker_group = None
+
+def init_worker(reader):
+    """
+    The initializer of worker processes, which evaluate cells with :func:`read_in_worker`. The
+    reader is opened once per worker process and closed when the worker exits, so expensive state
+    created by :func:`readers.Reader.open` is reused for all cells the worker evaluates.
+
+    :type reader: :class:`readers.Reader`
+    :param reader: The reader, which is sent to the worker process once.
+    """
+
+    global _worker_reader, _worker_group
+
+    import multiprocessing.util
+
+    _worker_reader = reader
+    _worker_group = None
+    reader.open()
+    multiprocessing.util.Finalize(None, _finalize_worker, exitpriority = 10)
+
+def _finalize_worker():
+    global _worker_group
+
+    if _worker_group is not None:
+        _worker_reader.teardown()
+        _worker_group = None
+    _worker_reader.close()
+
+def read_in_worker(group_params, params):
+    """
+    Read a cell in a worker process initialized by :func:`init_worker`. If the cell belongs to a
+    different group from the previous one evaluated by this worker, the reader is set up for the
+    new group first (see :attr:`readers.Reader.expensive_params`).
+
+    :type group_params: dict
+    :param group_params: The values of the expensive parameters of the cell, or ``None``.
+    :type params: dict
+    :param params: The parameters of the cell.
+    :return: What :func:`readers.Reader.read` returns.
+    """
+
+    global _worker_group
+
+    if group_params != _worker_group:
+        if _worker_group is not None:
+            _worker_reader.teardown()
+            _worker_group = None
+        if group_params is not None:
+            # torn down even if setting up fails
+            _worker_group = group_params
+            _worker_reader.setup(group_params)
+    return _worker_reader.read(params)
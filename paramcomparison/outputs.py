@@ -0,0 +1,376 @@
+# Copyright (c) 2015 Hong Xu <hong@topbug.net>
+
+# This file is part of ParamComparison.
+
+# ParamComparison is free software: you can redistribute it and/or modify it under the terms of the
+# GNU Lesser General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+
+# ParamComparison is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License along with
+# ParamComparison. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import abc
+import itertools
+import os
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+@six.add_metaclass(abc.ABCMeta)
+class Output(object):
+    """
+    The base class for all outputs, which define where the generated pages are stored. An output can
+    be used as a context manager, which closes it on exit.
+    """
+
+    @abc.abstractmethod
+    def write_page(self, file_name, chunks):
+        """
+        :type file_name: str
+        :param file_name: The file name of the page, as returned by
+             :func:`writers.Writer.get_file_name`.
+        :type chunks: iterable of str
+        :param chunks: The strings which make up the page. They may be generated lazily.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Finish writing all pages. Nothing is done by default.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class PrefixedOutput(Output):
+    """
+    An output which relays pages to another output, with a prefix added to their file names. It
+    doesn't close the other output.
+    """
+
+    def __init__(self, output, prefix):
+        """
+        :type output: :class:`Output`
+        :param output: The output to write the pages to.
+        :type prefix: str
+        :param prefix: The prefix of the file names.
+        """
+        self.output = output
+        self.prefix = prefix
+
+    def write_page(self, file_name, chunks):
+        """
+        See :func:`Output.write_page`.
+        """
+        self.output.write_page(self.prefix + file_name, chunks)
+
+_replace = getattr(os, 'replace', os.rename) # python 2 has no os.replace
+_tmp_counter = itertools.count()
+
+class DirectoryOutput(Output):
+    """
+    An output which writes each page to a file in a directory. Each page is first written to a
+    temporary file in the same directory, which is then renamed to the file name of the page, so
+    that no partially written page is left if writing is interrupted. File names may contain
+    subdirectories, which are created as needed.
+    """
+
+    def __init__(self, outdir):
+        """
+        :type outdir: str
+        :param outdir: The directory to write files to. It is created if it does not exist.
+        """
+        self.outdir = outdir
+        try:
+            os.mkdir(outdir)
+        except:
+            pass
+
+    def _tmp_path(self, file_name):
+        """
+        Create the directory of a page if it does not exist, e.g., when the file name of the page
+        has a prefix added by :class:`PrefixedOutput`.
+
+        :return: The path of a new temporary file in the directory of the page.
+        """
+
+        path = os.path.join(self.outdir, file_name)
+        dirname, basename = os.path.split(path)
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            if not os.path.isdir(dirname):
+                raise
+        return os.path.join(dirname, '.{}.{}-{}.tmp'.format(basename, os.getpid(),
+                                                            next(_tmp_counter)))
+
+    def write_page(self, file_name, chunks):
+        """
+        See :func:`Output.write_page`.
+        """
+
+        tmp_path = self._tmp_path(file_name)
+        try:
+            with open(tmp_path, 'w') as f:
+                f.writelines(chunks)
+            _replace(tmp_path, os.path.join(self.outdir, file_name))
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+class ThreadedDirectoryOutput(DirectoryOutput):
+    """
+    A :class:`DirectoryOutput` which writes files in a background thread. The pages are rendered in
+    the calling thread and passed to the background thread through a bounded queue in batches of
+    about ``batch_size`` characters, so that rendering only waits for disk I/O when the queue is
+    full. :func:`close` must be called (or the output used as a context manager) to wait for all
+    pages to be written; an error in the background thread is raised by the next call of
+    :func:`write_page` or :func:`close`. Pages may be written from several threads, in which case
+    they are passed to the background thread one after another.
+    """
+
+    def __init__(self, outdir, queue_size = 16, batch_size = 1 << 20):
+        """
+        :type outdir: str
+        :param outdir: See :class:`DirectoryOutput`.
+        :type queue_size: int
+        :param queue_size: The maximum number of batches waiting to be written.
+        :type batch_size: int
+        :param batch_size: The number of characters to collect before passing them to the
+             background thread.
+        """
+        DirectoryOutput.__init__(self, outdir)
+        self.batch_size = batch_size
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock() # the batches of a page must not interleave with others
+        self._exc_info = None
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        f = None
+        tmp_path = None
+        while True:
+            action, data = self._queue.get()
+            if self._exc_info is not None: # drain the queue after an error
+                if action is None:
+                    return
+                continue
+            try:
+                if action == 'open':
+                    tmp_path = self._tmp_path(data)
+                    f = open(tmp_path, 'w', self.batch_size)
+                elif action == 'write':
+                    f.write(data)
+                elif action == 'close':
+                    f.close()
+                    _replace(tmp_path, os.path.join(self.outdir, data))
+                    f = tmp_path = None
+                elif action == 'abort':
+                    f.close()
+                    os.remove(tmp_path)
+                    f = tmp_path = None
+                else: # stop
+                    return
+            except:
+                self._exc_info = sys.exc_info()
+                if f is not None:
+                    f.close()
+                    os.remove(tmp_path)
+                    f = tmp_path = None
+
+    def _check(self):
+        if self._exc_info is not None:
+            six.reraise(*self._exc_info)
+
+    def write_page(self, file_name, chunks):
+        """
+        See :func:`Output.write_page`.
+        """
+
+        self._check()
+        with self._lock:
+            self._queue.put(('open', file_name))
+            try:
+                batch = []
+                size = 0
+                for chunk in chunks:
+                    batch.append(chunk)
+                    size += len(chunk)
+                    if size >= self.batch_size:
+                        self._queue.put(('write', ''.join(batch)))
+                        batch = []
+                        size = 0
+                if batch:
+                    self._queue.put(('write', ''.join(batch)))
+            except:
+                self._queue.put(('abort', None))
+                raise
+            self._queue.put(('close', file_name))
+
+    def close(self):
+        """
+        Wait for all pages to be written.
+        """
+
+        if self._thread.is_alive():
+            self._queue.put((None, None))
+            self._thread.join()
+        self._check()
+
+def _encode(chunk):
+    return chunk.encode('utf-8') if isinstance(chunk, six.text_type) else chunk
+
+class ArchiveOutput(Output):
+    """
+    An output which writes all pages into a single compressed archive, either a zip file or a
+    gzip-compressed tar file. Each page is first written to a temporary file (kept in memory while
+    it is small) and only added to the archive once it is complete, so that no partially written
+    page is added if writing is interrupted. On
+    :func:`close`, a member named ``index.txt`` listing the file names of all pages, one per line,
+    is added. A single page can be read back with :func:`read_page`; this is fast for zip files,
+    which support random access, while tar files have to be decompressed up to the page.
+    """
+
+    INDEX_NAME = 'index.txt'
+
+    def __init__(self, path, fmt = None, spool_size = 1 << 20):
+        """
+        :type path: str
+        :param path: The path of the archive.
+        :type fmt: str
+        :param fmt: Either ``'zip'`` or ``'tar.gz'``. If ``None``, it is determined by the
+             extension of ``path`` (``.zip``, ``.tar.gz`` or ``.tgz``).
+        :type spool_size: int
+        :param spool_size: The size in bytes above which a page being written is moved from memory
+             to a temporary file on disk.
+        :raise ValueError: When the format is not supported.
+        """
+
+        if fmt is None:
+            fmt = _archive_format(path)
+        self.path = path
+        self.fmt = fmt
+        self.spool_size = spool_size
+        self.members = [] # the file names of all pages, in the order they are written
+        self._lock = threading.Lock() # pages may be written from several threads
+        if fmt == 'zip':
+            import zipfile
+            self._archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, True)
+        elif fmt == 'tar.gz':
+            import tarfile
+            self._archive = tarfile.open(path, 'w:gz')
+        else:
+            raise ValueError('Unsupported archive format "{}"'.format(fmt))
+
+    def write_page(self, file_name, chunks):
+        """
+        See :func:`Output.write_page`.
+        """
+
+        import tempfile
+
+        with tempfile.SpooledTemporaryFile(self.spool_size) as f:
+            for chunk in chunks:
+                f.write(_encode(chunk))
+            size = f.tell()
+            f.seek(0)
+            with self._lock:
+                self._add(file_name, f, size)
+                self.members.append(file_name)
+
+    def _add(self, file_name, f, size):
+        """
+        Add a member to the archive.
+
+        :type f: file
+        :param f: The file to read the content of the member from.
+        :type size: int
+        :param size: The size of the content in bytes.
+        """
+
+        if self.fmt == 'zip':
+            if sys.version_info >= (3, 6): # stream into the archive
+                import shutil
+                with self._archive.open(file_name, 'w', force_zip64 = True) as member:
+                    shutil.copyfileobj(f, member)
+            else:
+                self._archive.writestr(file_name, f.read())
+        else:
+            import tarfile
+            import time
+            info = tarfile.TarInfo(file_name)
+            info.size = size
+            info.mtime = time.time()
+            self._archive.addfile(info, f)
+
+    def close(self):
+        """
+        Write the index and close the archive.
+        """
+
+        if self._archive is None:
+            return
+        import io
+        index = _encode(''.join(m + '\n' for m in self.members))
+        self._add(self.INDEX_NAME, io.BytesIO(index), len(index))
+        self._archive.close()
+        self._archive = None
+
+def _archive_format(path):
+    if path.endswith('.zip'):
+        return 'zip'
+    if path.endswith('.tar.gz') or path.endswith('.tgz'):
+        return 'tar.gz'
+    raise ValueError('Unknown archive format of "{}"'.format(path))
+
+def read_page(path, file_name, fmt = None):
+    """
+    Read a single page from an archive written by :class:`ArchiveOutput`, without extracting the
+    other pages.
+
+    :type path: str
+    :param path: The path of the archive.
+    :type file_name: str
+    :param file_name: The file name of the page, or ``ArchiveOutput.INDEX_NAME`` for the index.
+    :type fmt: str
+    :param fmt: See :class:`ArchiveOutput`.
+    :return: The content of the page.
+    :rtype: str
+    :raise KeyError: When the page does not exist.
+    """
+
+    if fmt is None:
+        fmt = _archive_format(path)
+    if fmt == 'zip':
+        import zipfile
+        with zipfile.ZipFile(path) as archive:
+            data = archive.read(file_name)
+    else:
+        import tarfile
+        archive = tarfile.open(path, 'r:gz')
+        try:
+            # stop decompressing as soon as the page is found
+            for member in archive:
+                if member.name == file_name:
+                    data = archive.extractfile(member).read()
+                    break
+            else:
+                raise KeyError('Page "{}" does not exist'.format(file_name))
+        finally:
+            archive.close()
+    return data.decode('utf-8')
@@ -16,47 +16,362 @@
 from __future__ import print_function
 
 import abc
+import collections
+import sys
+import threading
+
 import six
 
 @six.add_metaclass(abc.ABCMeta)
 class Reader(object):
     """
     The base class for all readers, which define how to read and process data.
+
+    A reader which loads an expensive artifact determined by some of the parameters (e.g., a model
+    checkpoint or a dataset) can list these parameters in :attr:`expensive_params`. The cells are
+    then evaluated in groups sharing the values of these parameters, and :func:`setup` and
+    :func:`teardown` are called before and after each group, so the artifact only has to be loaded
+    once per group.
+
+    A reader which holds expensive state (e.g., database connections, large arrays or file
+    handles) can create it in :func:`open` and release it in :func:`close`. When cells are
+    evaluated in worker processes, the reader is sent to each worker once and opened there, so the
+    state is created once per worker. A reader can also be used as a context manager, which opens
+    it on entry and closes it on exit. The context managers can be nested, in which case only the
+    outermost one opens and closes the reader; since a :class:`ParamComparison` opens its reader
+    the same way around each evaluation, a reader opened by the caller stays open (and its state
+    is reused) across evaluations.
+
+    A reader whose entries do not depend on some parameters, either always or for some values of
+    the other parameters, can return them from :func:`ignored_params`. Each combination of the
+    remaining parameters is then read only once, and the entry is copied to all the cells which
+    differ only in the ignored parameters.
     """
 
+    #: The names of the parameters which are expensive to change.
+    expensive_params = ()
+
+    #: The names of the metrics of each entry. If not empty, :func:`read` returns a dict from the
+    #: names of the metrics to their values, which are stored separately (see
+    #: :attr:`ParamComparison.metric_results`).
+    metrics = ()
+
+    # the number of nested context managers the reader is opened by
+    _open_depth = 0
+
     @abc.abstractmethod
     def read(self, params):
         """
         :type params: dict
         :param params: A dict which contains the values of parameters.
 
-        :return: The entry corresponding to the parameters.
-        :rtype: str
+        :return: The entry corresponding to the parameters, or a dict of the values of the
+             :attr:`metrics`.
+        :rtype: str or dict
         """
         raise NotImplementedError
 
+    def open(self):
+        """
+        Create the state needed by :func:`read`. Nothing is done by default. It may be called again
+        after :func:`close`.
+        """
+        pass
+
+    def close(self):
+        """
+        Release the state created by :func:`open`. Nothing is done by default.
+        """
+        pass
+
+    def __enter__(self):
+        if not self._open_depth:
+            self.open()
+        self._open_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._open_depth -= 1
+        if not self._open_depth:
+            self.close()
+
+    def dependencies(self, params):
+        """
+        List the input files which the entry corresponding to the parameters is read from. This is
+        used by :class:`watch.Watcher` to find the entries to read again when files change. By
+        default, there are none.
+
+        :type params: dict
+        :param params: A dict which contains the values of parameters.
+
+        :return: The paths of the files.
+        :rtype: sequence of str
+        """
+        return ()
+
+    def ignored_params(self, params):
+        """
+        List the parameters which the entry corresponding to the parameters does not depend on. The
+        result must not depend on the values of the listed parameters themselves. By default, there
+        are none.
+
+        :type params: dict
+        :param params: A dict which contains the values of parameters.
+
+        :return: The names of the ignored parameters.
+        :rtype: sequence of str
+        """
+        return ()
+
+    def setup(self, group_params):
+        """
+        Called before evaluating a group of cells. Nothing is done by default.
+
+        :type group_params: dict
+        :param group_params: A dict which contains the values of the parameters in
+             :attr:`expensive_params` shared by the group.
+        """
+        pass
+
+    def teardown(self):
+        """
+        Called after evaluating a group of cells, even if the evaluation failed. Nothing is done by
+        default.
+        """
+        pass
+
+def _freeze(value):
+    """
+    Convert a value to a hashable one, recursing into lists, tuples, sets and dicts. Unhashable
+    values of other types are represented by their ``repr``.
+    """
+
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((repr(k), _freeze(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(v) for v in value))
+    if isinstance(value, (set, frozenset)):
+        return (frozenset, tuple(sorted(repr(v) for v in value)))
+    try:
+        hash(value)
+    except TypeError:
+        return (repr, repr(value))
+    return value
+
+def params_key(params):
+    """
+    Build a canonical, hashable key of a dict of parameters, which does not depend on the order of
+    the items.
+
+    :type params: dict
+    :param params: A dict which contains the values of parameters.
+    :rtype: tuple
+    """
+
+    return tuple(sorted((k, _freeze(v)) for k, v in params.items()))
+
+# the group data of a UserFunctionReader outside of any group
+_NO_GROUP = object()
+
 class UserFunctionReader(Reader):
     """
     A class which relays the reading to a user function.
     """
 
-    def __init__(self, func, data):
+    def __init__(self, func, data, cache_size = None, cache_bytes = None, expensive_params = (),
+                 setup = None, teardown = None, data_factory = None, dependencies = None,
+                 ignored_params = (), metrics = ()):
         """
         :type func: function
         :param func: A user function which takes two parameters: ``data`` and ``params``. The
         function is defined by user and will be called in :func:`read`.
+        :type cache_size: int
+        :param cache_size: If not ``None``, memoize the results of ``func`` and keep at most this
+             many of them, evicting the least recently used ones.
+        :type cache_bytes: int
+        :param cache_bytes: If not ``None``, memoize the results of ``func`` and keep them within
+             approximately this many bytes (as measured by :func:`sys.getsizeof`), evicting the
+             least recently used ones.
+        :type expensive_params: sequence of str
+        :param expensive_params: See :attr:`Reader.expensive_params`.
+        :type setup: function
+        :param setup: A user function called by :func:`setup` with two parameters:
+             ``group_params`` and ``data``. Its return value, if not ``None``, replaces ``data``
+             for the group.
+        :type teardown: function
+        :param teardown: A user function called by :func:`teardown` with ``data`` as the
+             parameter.
+        :type data_factory: function
+        :param data_factory: A user function without parameters. If not ``None``, ``data`` is
+             replaced by its return value in :func:`open` and reset to ``None`` in :func:`close`,
+             so that the data is created in each worker process rather than sent to it.
+        :type dependencies: function
+        :param dependencies: A user function called by :func:`dependencies` with two parameters:
+             ``params`` and ``data``.
+        :type ignored_params: sequence of str or function
+        :param ignored_params: The names of the parameters which ``func`` never depends on, or a
+             user function called by :func:`ignored_params` with two parameters: ``params`` and
+             ``data``.
+        :type metrics: sequence of str
+        :param metrics: See :attr:`Reader.metrics`.
         """
         self.func = func
         self.data = data
+        self.expensive_params = tuple(expensive_params)
+        self.metrics = tuple(metrics)
+        self.setup_func = setup
+        self.teardown_func = teardown
+        self.data_factory = data_factory
+        self.dependencies_func = dependencies
+        self.ignored_params_func = (ignored_params if callable(ignored_params)
+                                    else tuple(ignored_params))
+        self._group_data = _NO_GROUP
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = collections.OrderedDict() # key -> (result, size)
+        self._cache_used_bytes = 0
+        self._cache_lock = threading.Lock()
 
     def read(self, params):
         """
         This function calls the user function. When calling the function, the first parameter is
-        params, and the second parameter of the data variable passed in in :func:`__init__`.
+        params, and the second parameter of the data variable passed in in :func:`__init__`. If
+        memoization is enabled, ``func`` is only called when the same ``params`` has not been read
+        before (or has been evicted).
 
         :return: What ``func`` returns.
 
         .. seealso:: :func:`Reader.read`.
         """
 
-        return self.func(params, self.data)
+        data = self.data if self._group_data is _NO_GROUP else self._group_data
+        if self.cache_size is None and self.cache_bytes is None:
+            return self.func(params, data)
+
+        key = params_key(params)
+        with self._cache_lock:
+            if key in self._cache:
+                self.cache_hits += 1
+                entry = self._cache.pop(key)
+                self._cache[key] = entry # mark as the most recently used
+                return entry[0]
+            self.cache_misses += 1
+
+        result = self.func(params, data)
+
+        size = sys.getsizeof(result) + sys.getsizeof(key)
+        with self._cache_lock:
+            if key in self._cache: # read by another thread meanwhile
+                self._cache_used_bytes -= self._cache.pop(key)[1]
+            self._cache[key] = (result, size)
+            self._cache_used_bytes += size
+            while self._cache and (
+                    (self.cache_size is not None and len(self._cache) > self.cache_size) or
+                    (self.cache_bytes is not None and self._cache_used_bytes > self.cache_bytes)):
+                self._cache_used_bytes -= self._cache.popitem(last = False)[1][1]
+
+        return result
+
+    def open(self):
+        """
+        Create ``data`` with ``data_factory``, if any.
+
+        .. seealso:: :func:`Reader.open`.
+        """
+
+        if self.data_factory is not None:
+            self.data = self.data_factory()
+
+    def close(self):
+        """
+        Reset ``data`` if it was created by ``data_factory``.
+
+        .. seealso:: :func:`Reader.close`.
+        """
+
+        if self.data_factory is not None:
+            self.data = None
+
+    def __getstate__(self):
+        # the lock can't be pickled, and memoized results are not worth sending to workers
+        state = self.__dict__.copy()
+        del state['_cache_lock']
+        del state['_group_data'] # the sentinel can't be pickled, and workers set up their groups
+        state.pop('_open_depth', None) # workers open the reader themselves
+        state['_cache'] = collections.OrderedDict()
+        state['_cache_used_bytes'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache_lock = threading.Lock()
+        self._group_data = _NO_GROUP
+
+    def dependencies(self, params):
+        """
+        Call the user function ``dependencies``, if any.
+
+        .. seealso:: :func:`Reader.dependencies`.
+        """
+
+        if self.dependencies_func is None:
+            return ()
+        return self.dependencies_func(params, self.data)
+
+    def ignored_params(self, params):
+        """
+        Return the names given as ``ignored_params``, or call the user function ``ignored_params``.
+
+        .. seealso:: :func:`Reader.ignored_params`.
+        """
+
+        if callable(self.ignored_params_func):
+            return self.ignored_params_func(params, self.data)
+        return self.ignored_params_func
+
+    def setup(self, group_params):
+        """
+        Call the user function ``setup``, if any.
+
+        .. seealso:: :func:`Reader.setup`.
+        """
+
+        if self.setup_func is not None:
+            data = self.setup_func(group_params, self.data)
+            self._group_data = self.data if data is None else data
+
+    def teardown(self):
+        """
+        Call the user function ``teardown``, if any.
+
+        .. seealso:: :func:`Reader.teardown`.
+        """
+
+        data = self.data if self._group_data is _NO_GROUP else self._group_data
+        self._group_data = _NO_GROUP
+        if self.teardown_func is not None:
+            self.teardown_func(data)
+
+    def cache_info(self):
+        """
+        :return: The statistics of memoization: ``hits``, ``misses``, ``size`` (the number of
+             memoized results) and ``bytes`` (their approximate size).
+        :rtype: dict
+        """
+
+        with self._cache_lock:
+            return {'hits': self.cache_hits, 'misses': self.cache_misses,
+                    'size': len(self._cache), 'bytes': self._cache_used_bytes}
+
+    def cache_clear(self):
+        """
+        Clear the memoized results and reset the statistics.
+        """
+
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_used_bytes = 0
+            self.cache_hits = 0
+            self.cache_misses = 0
@@ -0,0 +1,197 @@
+# Copyright (c) 2015 Hong Xu <hong@topbug.net>
+
+# This file is part of ParamComparison.
+
+# ParamComparison is free software: you can redistribute it and/or modify it under the terms of the
+# GNU Lesser General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+
+# ParamComparison is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License along with
+# ParamComparison. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Views of the results of a sub-grid, in which some fields are fixed, which look the results up in
+:attr:`ParamComparison.results` without copying them.
+"""
+
+from __future__ import print_function
+
+import itertools
+
+try:
+    from collections.abc import Mapping # python 3
+except ImportError:
+    from collections import Mapping
+
+class GridSlice(object):
+    """
+    A view of the results of the cells whose fixed fields have the given values, created by
+    :func:`ParamComparison.slice`. Iterating over it generates ``(key, result)`` of the cells in the
+    order of the grid, where ``key`` is the tuple of the values of the remaining fields in
+    :attr:`names`. The results are looked up in :attr:`ParamComparison.results` as needed, so the
+    view always reflects the current results.
+    """
+
+    def __init__(self, pc, fixed):
+        """
+        :type pc: :class:`ParamComparison`
+        :param pc: The object whose results are viewed.
+        :type fixed: dict: str -> str
+        :param fixed: The values of the fixed fields, as strings.
+        """
+
+        self.pc = pc
+        self.fixed = dict(fixed)
+        #: The names of the remaining fields, in the order of :attr:`ParamComparison.names`.
+        self.names = tuple(n for n in pc.names if n not in self.fixed)
+        #: The values of all fields, with ``None`` for the remaining ones, as the ``params``
+        #: parameter of :func:`writers.Writer.write_table`.
+        self.params = tuple(self.fixed.get(n) for n in pc.names)
+        self._idxs = tuple(pc.name_idx[n] for n in self.names)
+
+    def _full_key(self, key):
+        """
+        :return: The key in :attr:`ParamComparison.results` of the cell whose remaining fields have
+             the values ``key``.
+        """
+
+        full = list(self.params)
+        for i, v in zip(self._idxs, key):
+            full[i] = v
+        return tuple(full)
+
+    def __len__(self):
+        n = 1
+        for name in self.names:
+            n *= len(self.pc.grid[name])
+        return n
+
+    def __iter__(self):
+        results = self.pc.results
+        full = list(self.params)
+        idxs = self._idxs
+        for key in itertools.product(*(self.pc.grid[n] for n in self.names)):
+            for i, v in zip(idxs, key):
+                full[i] = v
+            yield key, results[tuple(full)]
+
+    def __getitem__(self, key):
+        """
+        :type key: tuple
+        :param key: The values (as strings) of the remaining fields in :attr:`names`.
+        :return: The result of the cell, or ``None`` if it has not been evaluated.
+        :raise KeyError: When the cell does not exist.
+        """
+
+        if len(key) != len(self.names):
+            raise KeyError(key)
+        return self.pc.results[self._full_key(key)]
+
+    def slice(self, **fixed):
+        """
+        Fix more fields.
+
+        .. seealso:: :func:`ParamComparison.slice`.
+        """
+
+        for name in fixed:
+            if name in self.fixed:
+                raise ValueError('Field "{}" is already fixed'.format(name))
+        fixed = self.pc.slice(**fixed).fixed
+        fixed.update(self.fixed)
+        return GridSlice(self.pc, fixed)
+
+    def _check_table_fields(self, row_field, col_field):
+        """
+        :return: The indices of the row and column field in :attr:`ParamComparison.names`.
+        :raise ValueError: When the remaining fields are not exactly the row and column field.
+        """
+
+        if row_field == col_field or set(self.names) != set((row_field, col_field)):
+            raise ValueError('The remaining fields {} are not "{}" and "{}"'.format(
+                self.names, row_field, col_field))
+        return self.pc.name_idx[row_field], self.pc.name_idx[col_field]
+
+    def table(self, row_field, col_field):
+        """
+        A view of the results as a table, which can be passed as the ``values`` parameter of
+        :func:`writers.Writer.write_table`.
+
+        :type row_field: str
+        :param row_field: The field used in rows.
+        :type col_field: str
+        :param col_field: The field used in columns.
+        :return: A mapping from ``(row value, column value)`` to the result.
+        :rtype: :class:`TableView`
+        :raise ValueError: When the remaining fields are not exactly ``row_field`` and
+             ``col_field``.
+        """
+
+        row_idx, col_idx = self._check_table_fields(row_field, col_field)
+        return TableView(self, row_idx, col_idx)
+
+    def matrix(self, row_field, col_field):
+        """
+        :type row_field: str
+        :param row_field: The field used in rows.
+        :type col_field: str
+        :param col_field: The field used in columns.
+        :return: The results as a list of rows, in the order of the values in the grid.
+        :rtype: list of lists
+        :raise ValueError: When the remaining fields are not exactly ``row_field`` and
+             ``col_field``.
+        """
+
+        table = self.table(row_field, col_field)
+        return [[table[(r, c)] for c in table.col_values] for r in table.row_values]
+
+    def write_table(self, writer, row_field, col_field):
+        """
+        Write the results as a table.
+
+        :type writer: :class:`writers.Writer`
+        :param writer: The writer to be used.
+        :return: The table string, as returned by :func:`writers.Writer.write_table`.
+        :rtype: str
+
+        .. seealso:: :func:`table` for the other parameters.
+        """
+
+        table = self.table(row_field, col_field)
+        return writer.write_table(self.pc.names, self.params, table.row_idx, table.row_values,
+                                  table.col_idx, table.col_values, table)
+
+class TableView(Mapping):
+    """
+    A view of the results of a :class:`GridSlice` with two remaining fields as a mapping from
+    ``(row value, column value)`` to the result, created by :func:`GridSlice.table`.
+    """
+
+    def __init__(self, grid_slice, row_idx, col_idx):
+        names = grid_slice.pc.names
+        self._results = grid_slice.pc.results
+        self._params = grid_slice.params
+        self.row_idx = row_idx
+        self.col_idx = col_idx
+        self.row_values = grid_slice.pc.grid[names[row_idx]]
+        self.col_values = grid_slice.pc.grid[names[col_idx]]
+
+    def __getitem__(self, key):
+        try:
+            r, c = key
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        full = list(self._params)
+        full[self.row_idx] = r
+        full[self.col_idx] = c
+        return self._results[tuple(full)]
+
+    def __iter__(self):
+        return iter(itertools.product(self.row_values, self.col_values))
+
+    def __len__(self):
+        return len(self.row_values) * len(self.col_values)
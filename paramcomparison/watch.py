@@ -0,0 +1,127 @@
+# Copyright (c) 2015 Hong Xu <hong@topbug.net>
+
+# This file is part of ParamComparison.
+
+# ParamComparison is free software: you can redistribute it and/or modify it under the terms of the
+# GNU Lesser General Public License as published by the Free Software Foundation, either version 3
+# of the License, or (at your option) any later version.
+
+# ParamComparison is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License along with
+# ParamComparison. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Polling of the input files of readers, to keep the results and pages up to date while the inputs
+are still changing, e.g. while experiments are running.
+"""
+
+from __future__ import print_function
+
+import collections
+import os
+import time
+
+import six
+
+def _file_signature(path):
+    """
+    :return: The modification time and size of a file, or ``None`` if it does not exist.
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+class Watcher(object):
+    """
+    A class which polls the input files of the cells of a :class:`ParamComparison`, as declared by
+    :func:`readers.Reader.dependencies`, and evaluates again only the cells whose input files have
+    changed (by modification time or size). Each file is checked once per poll, however many cells
+    depend on it.
+    """
+
+    def __init__(self, pc):
+        """
+        :type pc: :class:`ParamComparison`
+        :param pc: The object whose results are kept up to date. The current state of the input
+             files is taken as unchanged.
+        :raise ValueError: When ``pc`` has no reader, e.g., when it is created by
+             :func:`ParamComparison.from_results`.
+        """
+
+        if pc.reader is None:
+            raise ValueError('Results without a reader cannot be watched')
+        self.pc = pc
+        self.cells = collections.defaultdict(list) # file -> keys of the cells depending on it
+        for key in pc.results:
+            for path in pc.reader.dependencies(pc.cell_params(key)):
+                self.cells[path].append(key)
+        self.signatures = dict((path, _file_signature(path)) for path in self.cells)
+
+    def poll(self):
+        """
+        Check the input files once.
+
+        :return: The keys of the cells whose input files have changed since the last poll, in the
+             order of :attr:`ParamComparison.results`.
+        :rtype: list of tuples
+        """
+
+        changed = set()
+        for path, signature in six.iteritems(self.signatures):
+            new_signature = _file_signature(path)
+            if new_signature != signature:
+                self.signatures[path] = new_signature
+                changed.update(self.cells[path])
+        return [key for key in self.pc.results if key in changed] if changed else []
+
+    def refresh(self):
+        """
+        Poll the input files and evaluate the cells whose input files have changed. The reader is
+        opened for each evaluation, unless it is kept open by the caller (see
+        :class:`readers.Reader`).
+
+        :return: The keys of the cells evaluated.
+        :rtype: list of tuples
+        """
+
+        keys = self.poll()
+        if keys:
+            self.pc.reevaluate(keys)
+        return keys
+
+    def watch(self, outdir, writer, row_field, col_field, interval = 60, max_polls = None):
+        """
+        Generate the pages, then keep refreshing the results every ``interval`` seconds and
+        generate the pages again whenever any cell has changed. Since every page of a pivot shows
+        all cells, the pages are all generated again after a change, but nothing is evaluated or
+        written if no input file has changed. The reader is kept open while watching.
+
+        :type outdir: str or :class:`outputs.Output`
+        :param outdir: See :func:`ParamComparison.generate_pages`.
+        :type writer: :class:`writers.Writer` (or its subclass) object
+        :param writer: See :func:`ParamComparison.generate_pages`.
+        :type row_field: str
+        :param row_field: See :func:`ParamComparison.generate_pages`.
+        :type col_field: str
+        :param col_field: See :func:`ParamComparison.generate_pages`.
+        :type interval: float
+        :param interval: The time between two polls in seconds.
+        :type max_polls: int
+        :param max_polls: The number of polls after which to return. ``None`` means never return.
+        :return: None
+        """
+
+        self.pc.generate_pages(outdir, writer, row_field, col_field)
+        polls = 0
+        with self.pc.reader:
+            while max_polls is None or polls < max_polls:
+                time.sleep(interval)
+                polls += 1
+                if self.refresh():
+                    self.pc.generate_pages(outdir, writer, row_field, col_field)
@@ -46,6 +46,13 @@ class Writer(object):
         """
         raise NotImplementedError
 
+    def write_footer(self):
+        """
+        :return: The end of a page, which is written after everything else. Nothing by default.
+        :rtype: str
+        """
+        return ''
+
     @abc.abstractmethod
     def write_table(self, names, params, row_idx, row_values, col_idx, col_values,
                     values):
@@ -65,13 +72,24 @@ class Writer(object):
         :param col_values: A sequence of all possible values of the column fields.
         :type values: dict: (str, str) -> str
         :param values: A dictionary whose key is an element of the Cartesion product of row_values
-             and col_values, and value is the corresponding result in the table entry.
+             and col_values, and value is the corresponding result in the table entry, or ``None``
+             if the entry has not been evaluated.
 
         :return: The table string
         :rtype: str
         """
         raise NotImplementedError
 
+    def iter_table(self, names, params, row_idx, row_values, col_idx, col_values, values):
+        """
+        Generate the table in chunks. Writers which are able to stream large tables override this
+        method; by default the whole output of :func:`write_table` is generated as one chunk. The
+        arguments are the same as :func:`write_table`.
+
+        :return: A generator of strings, whose concatenation is the table.
+        """
+        yield self.write_table(names, params, row_idx, row_values, col_idx, col_values, values)
+
     @abc.abstractmethod
     def write_separator(self):
         """
@@ -80,23 +98,51 @@ class Writer(object):
         """
         raise NotImplementedError
 
+    def write_index(self, names):
+        """
+        Write the content of an index page, which links to other pages. By default, a table listing
+        the file names of the pages is written.
+
+        :type names: sequence of strings
+        :param names: The names of the pages, as passed to :func:`get_file_name`.
+
+        :return: The index string
+        :rtype: str
+        """
+
+        names = tuple(names)
+        values = dict(((n, 'file'), self.get_file_name(n)) for n in names)
+        return self.write_table(('page', 'link'), (None, None), 0, names, 1, ('file',), values)
+
 import os
 try:
     from StringIO import StringIO # python 2
 except:
     from io import StringIO
 
+def _fill_placeholder(values, placeholder):
+    """
+    :return: ``values`` with the entries which have not been evaluated replaced by ``placeholder``.
+    """
+
+    if all(v is not None for v in six.itervalues(values)):
+        return values
+    return dict((k, placeholder if v is None else v) for k, v in six.iteritems(values))
+
 class RstWriter(Writer):
     """
     A class to write RST output.
     """
 
-    def __init__(self, indent_size = 4):
+    def __init__(self, indent_size = 4, placeholder = '?'):
         """
         :type indent_size: int
         :param indent_size: The size of indent used in the rst output. Must be greater than 0.
+        :type placeholder: str
+        :param placeholder: The text of the entries which have not been evaluated.
         """
         self.indent_size = indent_size
+        self.placeholder = placeholder
 
     def get_file_name(self, name):
         """
@@ -116,6 +162,7 @@ class RstWriter(Writer):
         See :func:`Writer.write_table`.
         """
 
+        values = _fill_placeholder(values, self.placeholder)
         table = StringIO(os.linesep)
 
         # table title
@@ -212,3 +259,138 @@ class RstWriter(Writer):
         """
 
         return os.linesep + '----' + os.linesep + os.linesep
+
+    def write_index(self, names):
+        """
+        See :func:`Writer.write_index`. A toctree is written, which is understood by `Sphinx`_.
+
+        .. _Sphinx: http://sphinx-doc.org/
+        """
+
+        return (os.linesep + '.. toctree::' + os.linesep + os.linesep +
+                ''.join(' ' * self.indent_size + n + os.linesep for n in names))
+
+try:
+    from html import escape as _html_escape # python 3
+except ImportError:
+    from cgi import escape as _html_escape # python 2
+
+def _escape_cells(cells):
+    """
+    Escape a list of cells for HTML output in one pass.
+
+    The cells are joined by a NUL character, escaped as a single string and split again, which is
+    much faster than escaping every cell separately for large tables. If a cell happens to contain
+    NUL itself, fall back to escaping cell by cell.
+    """
+
+    escaped = _html_escape('\0'.join(cells), True).split('\0')
+    if len(escaped) != len(cells):
+        escaped = [_html_escape(c, True) for c in cells]
+    return escaped
+
+class HtmlWriter(Writer):
+    """
+    A class to write HTML output.
+
+    Unlike :class:`RstWriter`, no column widths are computed: the tables are emitted as plain
+    ``<table>`` markup which can be opened directly in a browser, so it is well suited for very
+    large tables.
+    """
+
+    def __init__(self, placeholder = '?'):
+        """
+        :type placeholder: str
+        :param placeholder: The text of the entries which have not been evaluated.
+        """
+        self.placeholder = placeholder
+
+    def get_file_name(self, name):
+        """
+        See :func:`Writer.get_file_name`.
+        """
+        return '{}.html'.format(name)
+
+    def write_title(self, comparison_param):
+        """
+        See :func:`Writer.write_title`. Since the title is the first thing written to a page, the
+        HTML header is also written here.
+        """
+        title = _html_escape(comparison_param, True)
+        return ('<!DOCTYPE html>' + os.linesep +
+                '<html><head><meta charset="utf-8"><title>' + title + '</title></head><body>' +
+                os.linesep + '<h1>' + title + '</h1>' + os.linesep)
+
+    def write_footer(self):
+        """
+        See :func:`Writer.write_footer`. The HTML document opened by :func:`write_title` is closed.
+        """
+        return '</body></html>' + os.linesep
+
+    def iter_table(self, names, params, row_idx, row_values, col_idx, col_values, values):
+        """
+        Generate the table in chunks of one row each, so that a large table can be streamed to a
+        file without building the whole string in memory first. The arguments are the same as
+        :func:`Writer.write_table`.
+
+        :return: A generator of strings, whose concatenation is the table.
+        """
+
+        values = _fill_placeholder(values, self.placeholder)
+        if len(names) > 2:
+            caption = ', '.join(sorted('{} = {}'.format(names[i], params[i])
+                                       for i in range(len(names))
+                                       if i != row_idx and i != col_idx))
+        else:
+            caption = ''
+
+        # escape everything in bulk: the caption, the field names, the column values, and then
+        # each row (row value followed by entries)
+        cells = [caption, names[row_idx], names[col_idx]]
+        cells.extend(col_values)
+        for r in row_values:
+            cells.append(r)
+            cells.extend(values[(r, c)] for c in col_values)
+        cells = _escape_cells(cells)
+
+        yield '<table border="1">' + os.linesep
+        if caption:
+            yield '<caption>' + cells[0] + '</caption>' + os.linesep
+        yield ('<tr><th>Row: ' + cells[1] + '<br>Col: ' + cells[2] + '</th><th>' +
+               '</th><th>'.join(cells[3:3 + len(col_values)]) + '</th></tr>' + os.linesep)
+        pos = 3 + len(col_values)
+        width = len(col_values) + 1
+        for i in range(len(row_values)):
+            row = cells[pos:pos + width]
+            pos += width
+            yield ('<tr><th>' + row[0] + '</th><td>' + '</td><td>'.join(row[1:]) + '</td></tr>' +
+                   os.linesep)
+        yield '</table>' + os.linesep
+
+    def write_table(self, names, params, row_idx, row_values, col_idx, col_values,
+                    values):
+        """
+        See :func:`Writer.write_table`.
+        """
+
+        return ''.join(self.iter_table(names, params, row_idx, row_values, col_idx, col_values,
+                                       values))
+
+    def write_separator(self):
+        """
+        See :func:`Writer.write_separator`.
+        """
+
+        return '<hr>' + os.linesep
+
+    def write_index(self, names):
+        """
+        See :func:`Writer.write_index`.
+        """
+
+        names = tuple(names)
+        cells = _escape_cells([self.get_file_name(n) for n in names] + list(names))
+        return ('<ul>' + os.linesep +
+                ''.join('<li><a href="{}">{}</a></li>'.format(f, n) + os.linesep
+                        for f, n in zip(cells[:len(names)], cells[len(names):])) +
+                '</ul>' + os.linesep)
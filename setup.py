@@ -35,5 +35,8 @@ setup(name='ParamComparison',
       url='http://paramcomp.topbug.net',
       packages=['paramcomparison'],
       license='LGPLv3+',
-      install_requires = required
+      install_requires = required,
+      entry_points = {
+          'console_scripts': ['paramcomparison = paramcomparison.cli:main']
+      }
      )
@@ -13,16 +13,35 @@
 # You should have received a copy of the GNU Lesser General Public License along with
 # ParamComparison. If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import unittest
 import os
+import sys
 
 import paramcomparison
-from paramcomparison.writers import RstWriter
-from paramcomparison.readers import UserFunctionReader
+from paramcomparison.writers import RstWriter, HtmlWriter
+from paramcomparison.readers import Reader, UserFunctionReader
 
 def f(params, data):
     return params['a'] + params['b'] + params['c'] + params['d']
 
+class WorkerReader(Reader):
+    """
+    A reader which records the process it is opened in
+    """
+
+    def __init__(self):
+        self.opened_in = None
+
+    def open(self):
+        self.opened_in = os.getpid()
+
+    def close(self):
+        self.opened_in = None
+
+    def read(self, params):
+        return '{}:{}'.format(params['a'], self.opened_in == os.getpid())
+
 class TestParamComparison(unittest.TestCase):
     """
     Test the class ParamComparison
@@ -248,12 +267,873 @@ c
             self.assertNotEqual(t_index, -1)
             self.assertLess(title_index, t_index)
 
+    def test_generate_pages_writers(self):
+        """
+        Test generating pages with several writers in a single traversal
+        """
+
+        import shutil
+        from paramcomparison.outputs import ArchiveOutput, read_page
+
+        writers = (RstWriter(), HtmlWriter())
+        for limits in ({}, {'max_tables': 3, 'jobs': 2}, {'max_cols': 1, 'memory_budget': 8}):
+            self.pc.generate_pages(['tmp', 'tmp3'], writers, 'a', 'b', **limits)
+            limits.pop('jobs', None)
+            for writer, d in zip(writers, ('tmp', 'tmp3')):
+                self.pc.generate_pages('tmp2', writer, 'a', 'b', **limits)
+                self.assertEqual(sorted(os.listdir(d)), sorted(os.listdir('tmp2')))
+                for name in os.listdir('tmp2'):
+                    with open(os.path.join(d, name)) as f1, open(os.path.join('tmp2', name)) as f2:
+                        self.assertEqual(f1.read(), f2.read())
+                shutil.rmtree('tmp2')
+                shutil.rmtree(d)
+
+        os.mkdir('tmp')
+        with ArchiveOutput('tmp/pages.zip') as output:
+            self.pc.generate_pages([output, 'tmp2'], writers, 'a', 'b')
+        with open('tmp2/c.html') as page:
+            self.assertEqual(read_page('tmp/pages.zip', 'c.rst').count('.. table::'),
+                             page.read().count('<table'))
+
+        self.assertRaises(ValueError, self.pc.generate_pages, ['tmp'], writers, 'a', 'b')
+        self.assertRaises(TypeError, self.pc.generate_pages, ['tmp', 'tmp2'],
+                          [RstWriter(), None], 'a', 'b')
+
+    def test_generate_pivots(self):
+        """
+        Test generate_pivots function
+        """
+
+        self.assertRaises(TypeError, self.pc.generate_pivots, 'tmp', None)
+        self.assertRaisesRegexp(ValueError, 'Field "non-existent-field" does not exist',
+                               self.pc.generate_pivots,
+                               'tmp', RstWriter(), [('a', 'non-existent-field')])
+
+        dirs = self.pc.generate_pivots('tmp', RstWriter(), [('a', 'b'), ('c', 'd')], jobs = 2)
+        self.assertEqual(dirs, [os.path.join('tmp', 'a-b'), os.path.join('tmp', 'c-d')])
+        self.pc.generate_pages('tmp2', RstWriter(), 'a', 'b')
+        for name in ('c', 'd'):
+            with open(os.path.join('tmp', 'a-b', name + '.rst')) as f1:
+                with open(os.path.join('tmp2', name + '.rst')) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+        self.assertTrue(os.path.exists(os.path.join('tmp', 'c-d', 'a.rst')))
+
+        # all pairs
+        dirs = self.pc.generate_pivots('tmp3', HtmlWriter())
+        self.assertEqual(len(dirs), 6)
+        for d in dirs:
+            self.assertEqual(len(os.listdir(d)), 2)
+
+        class SequentialStore(dict):
+            """
+            A store which only allows sequential reads, counting the cells read
+            """
+
+            reads = 0
+
+            def __getitem__(self, key):
+                raise AssertionError('random access')
+
+            def items(self):
+                for item in dict.items(self):
+                    SequentialStore.reads += 1
+                    yield item
+
+            iteritems = items
+
+        # the store is read once per pivot, whatever the number of pages
+        results = self.pc.results
+        self.pc.results = SequentialStore(results)
+        self.pc.generate_pivots('tmp2', RstWriter(), [('a', 'b'), ('c', 'd')], max_tables = 4)
+        self.assertEqual(SequentialStore.reads, 2 * len(results))
+        self.pc.results = results
+        self.pc.generate_pages('tmp3/pages', RstWriter(), 'a', 'b', max_tables = 4)
+        self.assertEqual(sorted(os.listdir('tmp3/pages')), sorted(os.listdir('tmp2/a-b')))
+        for name in os.listdir('tmp3/pages'):
+            with open(os.path.join('tmp2', 'a-b', name)) as f1:
+                with open(os.path.join('tmp3', 'pages', name)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+    def test_generate_pages_split(self):
+        """
+        Test generate_pages with limits on tables and pages
+        """
+
+        self.pc.generate_pages('tmp', RstWriter(), 'a', 'b', max_rows = 1, max_tables = 4)
+        self.assertEqual(sorted(os.listdir('tmp')),
+                         ['c-1.rst', 'c-2.rst', 'c-3.rst', 'c.rst', 'd-1.rst', 'd-2.rst', 'd-3.rst',
+                          'd.rst'])
+        with open('tmp/c.rst') as page:
+            self.assertNotEqual(page.read().find('''
+.. toctree::
+
+    c-1
+    c-2
+    c-3
+            '''.strip()), -1)
+        with open('tmp/d-1.rst') as page:
+            d = page.read()
+            self.assertEqual(d.count('.. table::'), 4)
+            self.assertNotEqual(d.find('''
+    +------+--+--+
+    |Row: a|3 |4 |
+    |Col: b|  |  |
+    +------+--+--+
+    |2     |17|18|
+    +------+--+--+
+            '''.strip()), -1)
+            # no separator at the beginning of a page
+            self.assertEqual(d.find(RstWriter().write_separator()), -1)
+        with open('tmp/d-2.rst') as page:
+            d = page.read()
+            separator_index = d.find(RstWriter().write_separator())
+            self.assertLess(d.find('c = 5, d = 9'), separator_index)
+            self.assertLess(separator_index, d.find('c = 6, d = 7'))
+
+        # split by size, the tables of which are split by columns
+        self.pc.generate_pages('tmp2', HtmlWriter(), 'a', 'b', max_cols = 1, max_bytes = 1000)
+        self.assertTrue(os.path.exists('tmp2/c-2.html'))
+        with open('tmp2/c.html') as page:
+            self.assertNotEqual(page.read().find('<li><a href="c-1.html">c-1</a></li>'), -1)
+        with open('tmp2/c-1.html') as page:
+            self.assertEqual(page.read().count('<th>Row: a<br>Col: b</th><th>3</th></tr>'), 3)
+
+        # no split if the pages are small enough
+        self.pc.generate_pages('tmp3', RstWriter(), 'a', 'b', max_tables = 6)
+        self.assertEqual(sorted(os.listdir('tmp3')), ['c.rst', 'd.rst'])
+
+    def test_generate_pages_memory_budget(self):
+        """
+        Test generate_pages reading the results sequentially in chunks
+        """
+
+        class SequentialStore(dict):
+            """
+            A store which only allows sequential reads, counting the cells read
+            """
+
+            reads = 0
+
+            def __getitem__(self, key):
+                raise AssertionError('random access')
+
+            def items(self):
+                for item in dict.items(self):
+                    SequentialStore.reads += 1
+                    yield item
+
+            iteritems = items
+
+        pc = paramcomparison.ParamComparison(
+            collections.OrderedDict((('a', [1,2]), ('b', [3,4]), ('c', [5,6]), ('d', [7,8,9]))),
+            UserFunctionReader(f, None))
+        store = SequentialStore(pc.results)
+        for row_field, col_field, pages in (('c', 'd', ('a.rst', 'b.rst')),
+                                            ('a', 'b', ('c.rst', 'd.rst'))):
+            pc.results = dict(store)
+            pc.generate_pages('tmp', RstWriter(), row_field, col_field)
+            pc.results = store
+            SequentialStore.reads = 0
+            # a window of 12 cells, i.e., 2 or 3 tables
+            pc.generate_pages('tmp2', RstWriter(), row_field, col_field, memory_budget = 12)
+            if row_field == 'c':
+                # the tables are laid out in the store in about the order they are written, so
+                # the store is read once per page
+                self.assertEqual(SequentialStore.reads, 2 * len(store))
+            for name in pages:
+                with open(os.path.join('tmp', name)) as f1:
+                    with open(os.path.join('tmp2', name)) as f2:
+                        self.assertEqual(f1.read(), f2.read())
+
+        # cells missing in the store
+        del store[('1', '3', '5', '7')]
+        pc.generate_pages('tmp2', RstWriter(), 'c', 'd', memory_budget = 12)
+        with open('tmp2/a.rst') as page:
+            self.assertEqual(page.read().count('?'), 1)
+
+    def test_aggregate(self):
+        """
+        Test aggregate, best and generate_aggregate_page functions
+        """
+
+        a = self.pc.aggregate(('a', 'd'))
+        self.assertEqual(sorted(a.keys()), ['a', 'd'])
+        self.assertEqual(a['a']['1']['count'], 12)
+        self.assertEqual(a['a']['1']['min'], 16)
+        self.assertEqual(a['a']['1']['max'], 20)
+        self.assertEqual(a['a']['1']['mean'], 18)
+        self.assertEqual(a['d']['9']['argmax'], {'a': '2', 'b': '4', 'c': '6', 'd': '9'})
+        self.assertRaises(ValueError, self.pc.aggregate, ('non-existent-field',))
+
+        self.assertEqual(self.pc.best(), ({'a': '1', 'b': '3', 'c': '5', 'd': '7'}, '16'))
+        self.assertEqual(self.pc.best(maximize = True),
+                         ({'a': '2', 'b': '4', 'c': '6', 'd': '9'}, '21'))
+
+        # non-numeric entries are skipped
+        pc = paramcomparison.ParamComparison({'a': (1, 2), 'b': (3, 4)},
+            UserFunctionReader(lambda params, data: params['a'] if params['b'] == 3 else 'never',
+                               None))
+        a = pc.aggregate()
+        self.assertEqual(a['b']['4']['count'], 0)
+        self.assertIsNone(a['b']['4']['mean'])
+        self.assertEqual(a['b']['3']['mean'], 1.5)
+        self.assertIsNone(paramcomparison.ParamComparison({'a': (1, 2)},
+            UserFunctionReader(lambda params, data: 'never', None)).best())
+
+        self.assertRaises(TypeError, self.pc.generate_aggregate_page, 'tmp', None)
+        self.pc.generate_aggregate_page('tmp', RstWriter())
+        with open('tmp/aggregate.rst', 'r') as f:
+            c = f.read()
+            self.assertNotEqual(c.find('|1             |16 |20 |18  |b = 3, c = 5, d = 7|'), -1)
+            self.assertNotEqual(c.find('|result    |16 |21 |'), -1)
+
+    def test_leaderboard(self):
+        """
+        Test leaderboard and generate_leaderboard_page functions
+        """
+
+        board = self.pc.leaderboard(3)
+        self.assertEqual(len(board), 3)
+        self.assertEqual(board[0], ({'a': '1', 'b': '3', 'c': '5', 'd': '7'}, '16'))
+        self.assertEqual([r for p, r in board], ['16', '17', '17'])
+        board = self.pc.leaderboard(2, maximize = True)
+        self.assertEqual([r for p, r in board], ['21', '20'])
+        self.assertEqual(len(self.pc.leaderboard(100)), 24)
+
+        # streaming variant skips non-numeric entries
+        cells = iter([({'x': 1}, '3'), ({'x': 2}, 'never'), ({'x': 3}, '1'), ({'x': 4}, '2')])
+        self.assertEqual(paramcomparison.top_k(cells, 2), [({'x': 3}, '1'), ({'x': 4}, '2')])
+
+        self.assertRaises(TypeError, self.pc.generate_leaderboard_page, 'tmp', None, 3)
+        self.pc.generate_leaderboard_page('tmp', RstWriter(), 2, maximize = True)
+        with open('tmp/leaderboard.rst', 'r') as f:
+            c = f.read()
+            values = dict(a = '2', b = '4', c = '6', d = '9')
+            self.assertNotEqual(c.find('|1         |{}|21    |'.format(
+                '|'.join(values[n] for n in self.pc.names))), -1)
+            self.assertNotEqual(c.find('|2         |'), -1)
+            self.assertEqual(c.find('|3         |'), -1)
+
+    def test_diff(self):
+        """
+        Test diff and generate_diff_pages functions
+        """
+
+        def g(params, data):
+            if params['a'] == 2 and params['c'] == 6 and params['d'] == 9:
+                return 100
+            if params['a'] == 1 and params['c'] == 5 and params['d'] == 7:
+                return f(params, data) + 0.001
+            return f(params, data)
+
+        # a new run with the fields in another order and another value of d
+        other = paramcomparison.ParamComparison(
+            collections.OrderedDict((('d', [7,8,9,10]), ('c', [5,6]), ('b', [3,4]), ('a', [1,2]))),
+            UserFunctionReader(g, None))
+
+        differences = self.pc.diff(other, tolerance = 0.01)
+        k = lambda a, b, c, d: tuple(dict(a = a, b = b, c = c, d = d)[n] for n in self.pc.names)
+        self.assertEqual(sorted(differences['changed']),
+                         sorted([(k('2', '3', '6', '9'), '20', '100'),
+                                 (k('2', '4', '6', '9'), '21', '100')]))
+        self.assertEqual(len(differences['added']), 8)
+        self.assertIn(k('1', '3', '5', '10'), differences['added'])
+        self.assertEqual(differences['removed'], [])
+        self.assertEqual(len(self.pc.diff(other)['changed']), 4)
+        self.assertEqual(self.pc.diff(self.pc), {'changed': [], 'added': [], 'removed': []})
+        self.assertRaises(ValueError, self.pc.diff, paramcomparison.ParamComparison(
+            {'a': [1]}, UserFunctionReader(lambda params, data: 1, None)))
+
+        self.pc.generate_diff_pages(other, 'tmp', RstWriter(), 'a', 'b', tolerance = 0.01)
+        with open('tmp/c.rst') as page:
+            c = page.read()
+            self.assertEqual(c.count('.. table::'), 3)
+            self.assertNotEqual(c.find('.. table:: c = 6, d = 9'), -1)
+            self.assertNotEqual(c.find('|2     |20 -> 100|21 -> 100|'), -1)
+            self.assertNotEqual(c.find('.. table:: c = 5, d = 10'), -1)
+            self.assertNotEqual(c.find('|1     |(none) -> 19|(none) -> 20|'), -1)
+
+    def test_metrics(self):
+        """
+        Test readers returning several metrics
+        """
+
+        import csv
+        from paramcomparison.outputs import ArchiveOutput, DirectoryOutput, read_page
+
+        calls = []
+        def read(params, data):
+            calls.append(params)
+            return {'sum': params['a'] + params['b'], 'product': params['a'] * params['b']}
+
+        grid = collections.OrderedDict((('a', [1,2]), ('b', [3,4]), ('c', [5,6])))
+        pc = paramcomparison.ParamComparison(
+            grid, UserFunctionReader(read, None, metrics = ('sum', 'product')))
+        self.assertEqual(len(calls), 8)
+        self.assertEqual(pc.metrics, ('sum', 'product'))
+        self.assertIs(pc.results, pc.metric_results['sum'])
+        self.assertEqual(pc.metric_results['product'][('2', '4', '5')], '8')
+        self.assertEqual(pc.metric('product').best(maximize = True)[1], '8')
+        self.assertRaises(ValueError, pc.metric, 'non-existent-metric')
+
+        # views and objects created from results have no reader to evaluate cells with
+        from paramcomparison.watch import Watcher
+        stored = paramcomparison.ParamComparison.from_results(grid, {('1', '3', '5'): 4})
+        self.assertEqual(stored.results[('1', '3', '5')], '4')
+        for other in (pc.metric('product'), stored):
+            self.assertRaises(ValueError, other.fill)
+            self.assertRaises(ValueError, other.reevaluate, [('1', '3', '5')])
+            self.assertRaises(ValueError, next, other.iter_results())
+            self.assertRaises(ValueError, Watcher, other)
+
+        pc.generate_pages('tmp', RstWriter(), 'a', 'b')
+        self.assertEqual(sorted(os.listdir('tmp')), ['product', 'sum'])
+        with open('tmp/product/c.rst') as page:
+            self.assertNotEqual(page.read().find('|2     |6|8|'), -1)
+        with open('tmp/sum/c.rst') as page:
+            self.assertNotEqual(page.read().find('|2     |5|6|'), -1)
+
+        with ArchiveOutput('tmp/pages.zip') as output:
+            pc.generate_pages(output, RstWriter(), 'a', 'b', metrics = ['sum'])
+        self.assertNotEqual(read_page('tmp/pages.zip', 'sum/c.rst').find('|2     |5|6|'), -1)
+        with DirectoryOutput('tmp2') as output:
+            pc.generate_pages(output, RstWriter(), 'a', 'b')
+        self.assertEqual(sorted(os.listdir('tmp2')), ['product', 'sum'])
+        for m in ('product', 'sum'):
+            with open(os.path.join('tmp', m, 'c.rst')) as f1:
+                with open(os.path.join('tmp2', m, 'c.rst')) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+        self.assertRaises(ValueError, pc.generate_pages, 'tmp2', RstWriter(), 'a', 'b',
+                          metrics = ['time'])
+
+        pc.export('tmp/results.csv')
+        with open('tmp/results.csv', 'r') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['a', 'b', 'c', 'sum', 'product'])
+        self.assertIn(['2', '3', '6', '5', '6'], rows)
+
+    def test_slice(self):
+        """
+        Test views of sub-grids
+        """
+
+        pc = paramcomparison.ParamComparison(
+            collections.OrderedDict((('a', [1,2]), ('b', [3,4]), ('c', [5,6]), ('d', [7,8,9]))),
+            UserFunctionReader(f, None))
+        s = pc.slice(c = 6, d = '9')
+        self.assertEqual(s.names, ('a', 'b'))
+        self.assertEqual(len(s), 4)
+        self.assertEqual(s[('2', '3')], '20')
+        self.assertEqual(list(s)[0], (('1', '3'), pc.results[('1', '3', '6', '9')]))
+        pc.results[('1', '4', '6', '9')] = 'x'
+        self.assertEqual(s.matrix('a', 'b'), [['19', 'x'], ['20', '21']])
+        self.assertEqual(s.matrix('b', 'a'), [['19', '20'], ['x', '21']])
+
+        a, b = pc.name_idx['a'], pc.name_idx['b']
+        params = tuple(dict(c = '6', d = '9').get(n) for n in pc.names)
+        self.assertEqual(s.write_table(RstWriter(), 'a', 'b'), RstWriter().write_table(
+            pc.names, params, a, ('1', '2'), b, ('3', '4'),
+            pc._table_values(params, a, b)))
+        self.assertEqual(dict(s.table('a', 'b')), pc._table_values(params, a, b))
+
+        # the view reflects later changes of the results
+        pc.results[('2', '3', '6', '9')] = None
+        self.assertNotEqual(s.write_table(HtmlWriter(), 'a', 'b').find('?'), -1)
+
+        t = pc.slice(d = 9).slice(c = 6)
+        self.assertEqual(t.fixed, s.fixed)
+        self.assertEqual(len(pc.slice(d = 9)), 8)
+        self.assertRaises(ValueError, pc.slice(d = 9).matrix, 'a', 'b')
+        self.assertRaises(ValueError, pc.slice(d = 9).slice, d = 9)
+        self.assertRaises(ValueError, pc.slice, e = 1)
+        self.assertRaises(ValueError, pc.slice, d = 10)
+        self.assertRaises(KeyError, s.__getitem__, ('1',))
+
+    def test_export(self):
+        """
+        Test export function
+        """
+
+        import csv
+        import gzip
+        import json
+
+        os.mkdir('tmp')
+        self.pc.export('tmp/results.csv')
+        with open('tmp/results.csv', 'r') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(tuple(rows[0]), self.pc.names + ('result',))
+        self.assertEqual(len(rows), 25)
+        for row in rows[1:]:
+            self.assertEqual(self.pc.results[tuple(row[:-1])], row[-1])
+
+        self.pc.export('tmp/results.jsonl.gz', 'jsonl')
+        with gzip.open('tmp/results.jsonl.gz', 'rb') as f:
+            records = [json.loads(line.decode('utf-8')) for line in f]
+        self.assertEqual(len(records), 24)
+        self.assertIn({'a': '1', 'b': '3', 'c': '5', 'd': '8', 'result': '17'}, records)
+
+        self.assertRaises(ValueError, self.pc.export, 'tmp/results.xml', 'xml')
+        self.assertRaises(ValueError, self.pc.export, 'tmp/results.csv', 'csv', None, 'a')
+
     def tearDown(self):
         import shutil
         shutil.rmtree('tmp', True)
         shutil.rmtree('tmp2', True)
         shutil.rmtree('tmp3', True)
 
+class TestEvaluate(unittest.TestCase):
+    """
+    Test the function evaluation.evaluate
+    """
+
+    def test_parallel(self):
+        """
+        Test parallel evaluation gives the same results
+        """
+
+        grid = collections.OrderedDict((('a', [1,2]), ('b', [3,4]), ('c', [5,6]), ('d', [7,8,9])))
+        pc = paramcomparison.ParamComparison(grid, UserFunctionReader(f, None), jobs = 4)
+        self.assertEqual(pc.results, paramcomparison.ParamComparison(
+            grid, UserFunctionReader(f, None)).results)
+        if sys.version_info >= (3, 7): # results are kept in the order of the grid
+            self.assertEqual(list(pc.results.keys())[:2],
+                             [('1', '3', '5', '7'), ('1', '3', '5', '8')])
+
+    def test_iter_results(self):
+        """
+        Test streaming the results while evaluating
+        """
+
+        seen = []
+        pc = paramcomparison.ParamComparison(
+            collections.OrderedDict((('a', [1,2]), ('b', [3,4,5]))),
+            UserFunctionReader(lambda p, d: p['a'] * p['b'], None),
+            on_result = lambda p, r: seen.append((p, r)), lazy = True)
+        self.assertEqual(pc.count_missing(), 6)
+        streamed = []
+        for params, result in pc.iter_results():
+            streamed.append((params, result))
+            if len(streamed) == 2:
+                break
+        self.assertEqual(streamed, [({'a': 1, 'b': 3}, '3'), ({'a': 1, 'b': 4}, '4')])
+        self.assertEqual(seen, streamed)
+        self.assertEqual(pc.count_missing(), 4)
+        # the remaining cells are evaluated on the next run
+        self.assertEqual(pc.fill(), 4)
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(pc.results[('2', '5')], '10')
+
+        # closing the generator stops the evaluation in parallel mode, before the reader is closed
+        import time
+        reads = []
+        def read(params, data):
+            time.sleep(0.01)
+            reads.append(data)
+            return params['a']
+        pc = paramcomparison.ParamComparison(
+            {'a': range(10), 'b': range(10)},
+            UserFunctionReader(read, None, data_factory = lambda: 'data'), jobs = 2, lazy = True)
+        for i, cell in enumerate(pc.iter_results()):
+            if i == 2:
+                break
+        count = len(reads)
+        self.assertLessEqual(count, 10)
+        time.sleep(0.05)
+        self.assertEqual(len(reads), count)
+        self.assertEqual(set(reads), set(['data']))
+
+    def test_ignored_params(self):
+        """
+        Test reading once the cells differing only in ignored parameters
+        """
+
+        calls = []
+        def read(params, data):
+            calls.append(params)
+            return params['a'] if params['mode'] == 'fixed' else params['a'] * params['h']
+
+        grid = collections.OrderedDict((('a', [1,2]), ('mode', ['fixed', 'scaled']),
+                                        ('h', [1,2,3])))
+        ignored = lambda params, data: ('h',) if params['mode'] == 'fixed' else ()
+        for jobs in (1, 3):
+            del calls[:]
+            pc = paramcomparison.ParamComparison(
+                grid, UserFunctionReader(read, None, ignored_params = ignored), jobs = jobs)
+            self.assertEqual(len(calls), 8)
+            self.assertEqual(pc.count_missing(), 0)
+            self.assertEqual(pc.results, paramcomparison.ParamComparison(
+                grid, UserFunctionReader(read, None)).results)
+
+        # ignored globally, and streamed through iter_results
+        del calls[:]
+        pc = paramcomparison.ParamComparison(
+            grid, UserFunctionReader(read, None, ignored_params = ('h', 'mode')), lazy = True)
+        self.assertEqual(len(list(pc.iter_results())), 12)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(pc.results[('2', 'scaled', '3')], '2')
+
+    def test_timeout(self):
+        """
+        Test cells exceeding the deadline
+        """
+
+        import time
+
+        def slow(params, data):
+            if params['a'] == 2:
+                time.sleep(5)
+            return params['a']
+
+        for jobs in (1, 2):
+            start = time.time()
+            pc = paramcomparison.ParamComparison({'a': [1, 2, 3]}, UserFunctionReader(slow, None),
+                                                 jobs = jobs, timeout = 0.2, timeout_value = 'T')
+            self.assertLess(time.time() - start, 2)
+            self.assertEqual(pc.results, {('1',): '1', ('2',): 'T', ('3',): '3'})
+
+    def test_cost(self):
+        """
+        Test scheduling the most expensive cells first and learning the costs
+        """
+
+        import threading
+        from paramcomparison.evaluation import evaluate, cost_model
+
+        lock = threading.Lock()
+        calls = []
+        def read(params):
+            with lock:
+                calls.append(params)
+            return params
+
+        cells = [(i, i) for i in range(10)]
+        results = dict(evaluate(read, cells, jobs = 2, cost = lambda key, params: params % 4))
+        self.assertEqual(results, dict(cells))
+        # a single worker thread starts the cells in the scheduled order
+        del calls[:]
+        list(evaluate(read, cells, timeout = 10, cost = lambda key, params: params % 4))
+        self.assertEqual(calls, [3, 7, 2, 6, 1, 5, 9, 0, 4, 8])
+
+        timings = {('1', 'x'): 1., ('1', 'y'): 1., ('10', 'x'): 100.}
+        model = cost_model(timings)
+        self.assertEqual(model(('1', 'x')), 1.)
+        self.assertGreater(model(('10', 'y')), 10 * model(('1', 'y')))
+        self.assertEqual(cost_model({})(('1',)), 1.)
+
+        grid = {'a': [1,2], 'b': [3,4], 'c': [5,6], 'd': [7,8,9]}
+        pc = paramcomparison.ParamComparison(grid, UserFunctionReader(f, None), jobs = 2)
+        self.assertEqual(set(pc.timings), set(pc.results))
+        other = paramcomparison.ParamComparison(grid, UserFunctionReader(f, None), jobs = 2,
+                                                cost = pc.timings)
+        self.assertEqual(other.results, pc.results)
+        other = paramcomparison.ParamComparison(grid, UserFunctionReader(f, None), jobs = 2,
+                                                cost = lambda params: params['a'])
+        self.assertEqual(other.results, pc.results)
+
+    def test_speculate(self):
+        """
+        Test speculative re-execution of stragglers
+        """
+
+        import threading
+        import time
+        from paramcomparison.evaluation import evaluate
+
+        lock = threading.Lock()
+        calls = []
+        def read(params):
+            with lock:
+                calls.append(params)
+                first = len([p for p in calls if p == params]) == 1
+            # the first execution of cell 0 is a straggler
+            if params == 0 and first:
+                time.sleep(5)
+            return params
+
+        start = time.time()
+        results = list(evaluate(read, [(i, i) for i in range(8)], jobs = 2, speculate_after = 0.5))
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(sorted(results), [(i, i) for i in range(8)])
+        self.assertEqual(calls.count(0), 2)
+
+    def test_exception(self):
+        """
+        Test exceptions raised by the reader are propagated
+        """
+
+        from paramcomparison.evaluation import evaluate
+
+        def read(params):
+            raise KeyError(params)
+
+        self.assertRaises(KeyError, list, evaluate(read, [(0, 0)], jobs = 2))
+
+class TestSampling(unittest.TestCase):
+    """
+    Test budgeted evaluation of ParamComparison
+    """
+
+    def setUp(self):
+        self.calls = []
+
+        def g(params, data):
+            self.calls.append(params)
+            return f(params, data)
+
+        self.reader = UserFunctionReader(g, None)
+        self.param_space = {'a': [1,2], 'b': [3,4], 'c':[5,6], 'd': [7,8,9]}
+
+    def test_budget(self):
+        """
+        Test evaluating a sample of cells and filling the rest later
+        """
+
+        pc = paramcomparison.ParamComparison(self.param_space, self.reader, budget = 6, seed = 1)
+        self.assertEqual(len(self.calls), 6)
+        self.assertEqual(len(pc.results), 24)
+        self.assertEqual(pc.count_missing(), 18)
+
+        # every value of every field is covered
+        evaluated = [k for k, v in pc.results.items() if v is not None]
+        for name in pc.names:
+            self.assertEqual(set(k[pc.name_idx[name]] for k in evaluated), set(pc.grid[name]))
+
+        # unevaluated cells are rendered as placeholders
+        pc.generate_pages('tmp', RstWriter(placeholder = 'n/a'), 'a', 'b')
+        with open('tmp/c.rst') as page:
+            self.assertNotEqual(page.read().find('n/a'), -1)
+
+        self.assertEqual(pc.fill(10), 10)
+        self.assertEqual(pc.fill(), 8)
+        self.assertEqual(pc.count_missing(), 0)
+        self.assertEqual(len(self.calls), 24)
+        self.assertEqual(len(set(tuple(sorted(p.items())) for p in self.calls)), 24)
+        self.assertEqual(pc.results, paramcomparison.ParamComparison(
+            self.param_space, UserFunctionReader(f, None)).results)
+        self.assertEqual(pc.fill(), 0)
+
+    def test_time_budget(self):
+        """
+        Test evaluating cells within a time budget
+        """
+
+        import time
+
+        def slow(params, data):
+            time.sleep(0.05)
+            return 1
+
+        pc = paramcomparison.ParamComparison(self.param_space, UserFunctionReader(slow, None),
+                                             time_budget = 0.2)
+        self.assertGreater(pc.count_missing(), 0)
+        self.assertLess(pc.count_missing(), 24)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree('tmp', True)
+
+class TestGroups(unittest.TestCase):
+    """
+    Test the evaluation of cells grouped by expensive parameters
+    """
+
+    def test_groups(self):
+        """
+        Test setup and teardown are called once per group
+        """
+
+        events = []
+
+        def setup(group_params, data):
+            events.append(('setup', group_params))
+            return group_params['c'] * 100
+
+        def read(params, data):
+            events.append(('read', params['c']))
+            self.assertEqual(data, params['c'] * 100)
+            return f(params, None)
+
+        def teardown(data):
+            events.append(('teardown', data))
+
+        for jobs in (1, 3):
+            del events[:]
+            reader = UserFunctionReader(read, None, expensive_params = ('c',), setup = setup,
+                                        teardown = teardown)
+            pc = paramcomparison.ParamComparison({'a': [1,2], 'b': [3,4], 'c':[5,6], 'd': [7,8,9]},
+                                                 reader, jobs = jobs)
+            self.assertEqual(pc.results, paramcomparison.ParamComparison(
+                {'a': [1,2], 'b': [3,4], 'c':[5,6], 'd': [7,8,9]},
+                UserFunctionReader(f, None)).results)
+            self.assertEqual(events[0], ('setup', {'c': 5}))
+            self.assertEqual(events[1:13], [('read', 5)] * 12)
+            self.assertEqual(events[13:15], [('teardown', 500), ('setup', {'c': 6})])
+            self.assertEqual(events[15:27], [('read', 6)] * 12)
+            self.assertEqual(events[27:], [('teardown', 600)])
+            self.assertIsNone(reader.data)
+
+    def test_setup_failure(self):
+        """
+        Test teardown is called when setup fails, and setup returning None keeps the data
+        """
+
+        events = []
+
+        def setup(group_params, data):
+            if group_params['a'] == 2:
+                raise RuntimeError('setup failed')
+
+        reader = UserFunctionReader(lambda params, data: data, 'data', expensive_params = ('a',),
+                                    setup = setup, teardown = lambda data: events.append(data))
+        pc = paramcomparison.ParamComparison({'a': [1, 2]}, reader, lazy = True)
+        self.assertRaises(RuntimeError, pc.fill)
+        self.assertEqual(pc.results[('1',)], 'data')
+        self.assertEqual(events, ['data', 'data'])
+
+    def test_invalid(self):
+        """
+        Test non-existent expensive parameters
+        """
+
+        self.assertRaises(ValueError, paramcomparison.ParamComparison, {'a': [1, 2]},
+                          UserFunctionReader(f, None, expensive_params = ('x',)))
+
+class TestLifecycle(unittest.TestCase):
+    """
+    Test opening and closing readers
+    """
+
+    def test_context_manager(self):
+        """
+        Test readers as context managers
+        """
+
+        r = UserFunctionReader(lambda params, data: data[params['a']], None,
+                               data_factory = lambda: {1: 'x'})
+        with r as opened:
+            self.assertIs(opened, r)
+            self.assertEqual(r.read({'a': 1}), 'x')
+        self.assertIsNone(r.data)
+
+        # a reader opened by the caller is left open by evaluations
+        created = []
+        def factory():
+            created.append(True)
+            return {1: 'x', 2: 'y'}
+        r = UserFunctionReader(lambda params, data: data[params['a']], None,
+                               data_factory = factory)
+        with r:
+            pc = paramcomparison.ParamComparison({'a': [1, 2]}, r, lazy = True)
+            self.assertEqual(pc.fill(), 2)
+            self.assertIsNotNone(r.data)
+            self.assertEqual(pc.reevaluate([('1',)]), 1)
+            self.assertEqual(list(pc.iter_results()), [])
+            with r:
+                self.assertEqual(pc.reevaluate([('2',)]), 1)
+            self.assertIsNotNone(r.data)
+        self.assertIsNone(r.data)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(pc.results, {('1',): 'x', ('2',): 'y'})
+        # otherwise, each evaluation opens and closes it
+        pc.reevaluate([('1',)])
+        self.assertIsNone(r.data)
+        self.assertEqual(len(created), 2)
+
+    def test_threads(self):
+        """
+        Test the reader is opened in the calling process around evaluation
+        """
+
+        r = WorkerReader()
+        pc = paramcomparison.ParamComparison({'a': [1, 2, 3]}, r, jobs = 2)
+        self.assertEqual(sorted(pc.results.values()), ['1:True', '2:True', '3:True'])
+        self.assertIsNone(r.opened_in)
+
+    def test_processes(self):
+        """
+        Test the reader is opened once in each worker process
+        """
+
+        r = WorkerReader()
+        pc = paramcomparison.ParamComparison({'a': range(20)}, r, jobs = 2, processes = True)
+        self.assertEqual(len(pc.results), 20)
+        for k, v in pc.results.items():
+            self.assertEqual(v, k[0] + ':True')
+
+        # memoizing readers can be sent to workers
+        pc = paramcomparison.ParamComparison(
+            collections.OrderedDict((('a', [1,2]), ('b', [3,4]), ('c', [5,6]), ('d', [7,8,9]))),
+            UserFunctionReader(f, None, cache_size = 10), jobs = 2, processes = True)
+        self.assertEqual(pc.results[('1', '3', '5', '8')], '17')
+
+class TestWatcher(unittest.TestCase):
+    """
+    Test the class watch.Watcher
+    """
+
+    def setUp(self):
+        os.mkdir('tmp_watch')
+        for a in ('x', 'y'):
+            with open(os.path.join('tmp_watch', a), 'w') as f:
+                f.write(a)
+        self.reads = []
+
+        def read(params, data):
+            self.reads.append(params)
+            with open(os.path.join('tmp_watch', params['a'])) as f:
+                return f.read() + str(params['b'])
+
+        self.reader = UserFunctionReader(read, None, dependencies = lambda params, data:
+                                         [os.path.join('tmp_watch', params['a'])])
+        self.pc = paramcomparison.ParamComparison(
+            collections.OrderedDict((('a', ['x', 'y']), ('b', [1, 2]))), self.reader)
+
+    def test_refresh(self):
+        """
+        Test only the cells whose input files changed are evaluated again
+        """
+
+        from paramcomparison.watch import Watcher
+
+        w = Watcher(self.pc)
+        self.assertEqual(w.refresh(), [])
+        del self.reads[:]
+        with open(os.path.join('tmp_watch', 'y'), 'w') as f:
+            f.write('yy')
+        self.assertEqual(w.refresh(), [('y', '1'), ('y', '2')])
+        self.assertEqual(self.reads, [{'a': 'y', 'b': 1}, {'a': 'y', 'b': 2}])
+        self.assertEqual(self.pc.results, {('x', '1'): 'x1', ('x', '2'): 'x2',
+                                           ('y', '1'): 'yy1', ('y', '2'): 'yy2'})
+        self.assertEqual(w.refresh(), [])
+
+    def test_watch(self):
+        """
+        Test the pages are generated again after changes
+        """
+
+        from paramcomparison.watch import Watcher
+
+        w = Watcher(self.pc)
+        with open(os.path.join('tmp_watch', 'x'), 'w') as f:
+            f.write('xxx')
+        w.watch('tmp_watch/out', RstWriter(), 'a', 'b', interval = 0, max_polls = 1)
+        with open('tmp_watch/out/main.rst') as page:
+            self.assertNotEqual(page.read().find('|x     |xxx1|xxx2|'), -1)
+
+        # the reader is opened once while watching
+        opened = []
+        self.reader.open = lambda: opened.append(True)
+        w.poll = lambda: [('x', '1')] # changed at every poll
+        del self.reads[:]
+        w.watch('tmp_watch/out', RstWriter(), 'a', 'b', interval = 0, max_polls = 2)
+        self.assertEqual(len(self.reads), 2)
+        self.assertEqual(len(opened), 1)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree('tmp_watch', True)
+
 class TestRstWriter(unittest.TestCase):
     """
     Test the class writers.RstWriter
@@ -333,11 +1213,327 @@ class TestRstWriter(unittest.TestCase):
 
         self.assertNotEqual(self.w.write_separator().find('----'), -1)
 
+class TestHtmlWriter(unittest.TestCase):
+    """
+    Test the class writers.HtmlWriter
+    """
+
+    def setUp(self):
+        self.w = HtmlWriter()
+
+    def test_get_file_name(self):
+        """
+        Test get_file_name
+        """
+
+        self.assertEqual(self.w.get_file_name('test'), 'test.html')
+
+    def test_write_title(self):
+        """
+        Test write_title method
+        """
+
+        title = self.w.write_title('a<b')
+        self.assertNotEqual(title.find('<h1>a&lt;b</h1>'), -1)
+
+    def test_write_footer(self):
+        """
+        Test every page is a complete HTML document
+        """
+
+        import shutil
+
+        pc = paramcomparison.ParamComparison({'a': [1,2], 'b': [3,4], 'c':[5,6], 'd': [7,8,9]},
+                                             UserFunctionReader(f, None))
+        try:
+            pc.generate_pages('tmp', self.w, 'a', 'b')
+            pc.generate_pages('tmp2', self.w, 'a', 'b', max_tables = 4)
+            pc.generate_aggregate_page('tmp', self.w)
+            pc.generate_leaderboard_page('tmp', self.w, 3)
+            for d in ('tmp', 'tmp2'):
+                for name in os.listdir(d):
+                    with open(os.path.join(d, name)) as page:
+                        content = page.read()
+                    self.assertTrue(content.startswith('<!DOCTYPE html>'))
+                    self.assertEqual(content.count('</body></html>'), 1)
+                    self.assertTrue(content.rstrip().endswith('</body></html>'))
+            self.assertIn('c-2.html', os.listdir('tmp2'))
+        finally:
+            shutil.rmtree('tmp', True)
+            shutil.rmtree('tmp2', True)
+        self.assertEqual(RstWriter().write_footer(), '')
+
+    def test_write_table(self):
+        """
+        Test write_table method
+        """
+
+        args = (('a', 'b', 'c'), (None, None, 'c_value'), 0, ('a1', 'a2'), 1, ('b1', 'b2'),
+                {('a1', 'b1'): 'a1b1',
+                 ('a1', 'b2'): '<a1b2>',
+                 ('a2', 'b1'): '',
+                 ('a2', 'b2'): 'a2&b2'})
+        table = self.w.write_table(*args)
+        self.assertNotEqual(table.find('<caption>c = c_value</caption>'), -1)
+        self.assertNotEqual(table.find('<tr><th>Row: a<br>Col: b</th><th>b1</th><th>b2</th></tr>'),
+                            -1)
+        self.assertNotEqual(table.find('<tr><th>a1</th><td>a1b1</td><td>&lt;a1b2&gt;</td></tr>'),
+                            -1)
+        self.assertNotEqual(table.find('<tr><th>a2</th><td></td><td>a2&amp;b2</td></tr>'), -1)
+
+        # streaming output is the same as the whole table
+        self.assertEqual(''.join(self.w.iter_table(*args)), table)
+
+    def test_write_separator(self):
+        """
+        Test write_separator method
+        """
+
+        self.assertNotEqual(self.w.write_separator().find('<hr>'), -1)
+
+class TestCli(unittest.TestCase):
+    """
+    Test the command line interface
+    """
+
+    def setUp(self):
+        import json
+        os.mkdir('tmp_cli')
+        with open('tmp_cli/cli_reader.py', 'w') as f:
+            f.write('def read(params, data):\n')
+            f.write('    return params["a"] + params["b"] + data\n')
+        with open('tmp_cli/spec.json', 'w') as f:
+            json.dump({'grid': {'a': {'range': [1, 3]}, 'b': {'linspace': [0, 1, 3]}},
+                       'reader': 'cli_reader:read', 'data': 10, 'row': 'a', 'col': 'b'}, f)
+
+    def test_ranges(self):
+        """
+        Test the range generators
+        """
+
+        from paramcomparison.cli import linspace, logspace, parse_grid
+        self.assertEqual(list(linspace(0.1, 0.3, 3)), [0.1, 0.2, 0.3])
+        self.assertEqual(list(linspace(1, 1, 1)), [1.0])
+        self.assertEqual(list(logspace(0, 2, 3)), [1.0, 10.0, 100.0])
+        grid = parse_grid({'a': {'range': [2]}, 'b': [1, 2]})
+        self.assertEqual(list(grid['a']), [0, 1])
+        self.assertRaises(ValueError, parse_grid, {'a': {'arange': [2]}})
+        self.assertRaises(ValueError, parse_grid, {'a': 2})
+
+    def test_main(self):
+        """
+        Test the main function
+        """
+
+        from paramcomparison.cli import main
+
+        self.assertEqual(main(['tmp_cli/spec.json', '-o', 'tmp_cli/out']), 0)
+        with open('tmp_cli/out/main.rst') as f:
+            self.assertNotEqual(f.read().find('|1     |11.0|11.5|12.0|'), -1)
+
+        self.assertEqual(main(['tmp_cli/spec.json', '-o', 'tmp_cli/html', '-f', 'html',
+                               '--all-pivots', '-j', '2']), 0)
+        self.assertTrue(os.path.exists('tmp_cli/html/a-b/main.html'))
+
+        self.assertEqual(main(['tmp_cli/spec.json', '-o', 'tmp_cli/csv', '-f', 'csv', '-z']), 0)
+        self.assertTrue(os.path.exists('tmp_cli/csv/results.csv.gz'))
+
+        from paramcomparison.outputs import read_page
+        self.assertEqual(main(['tmp_cli/spec.json', '-o', 'tmp_cli/pages.zip', '--all-pivots']), 0)
+        self.assertEqual(read_page('tmp_cli/pages.zip', 'index.txt'), 'a-b/main.rst\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree('tmp_cli', True)
+
+class TestOutputs(unittest.TestCase):
+    """
+    Test the outputs
+    """
+
+    def setUp(self):
+        self.pc = paramcomparison.ParamComparison({'a': [1,2], 'b': [3,4], 'c':[5,6], 'd': [7,8,9]},
+                                                  UserFunctionReader(f, None))
+
+    def failing_chunks(self):
+        yield 'partial'
+        raise RuntimeError('rendering failed')
+
+    def test_directory_output(self):
+        """
+        Test DirectoryOutput
+        """
+
+        from paramcomparison.outputs import DirectoryOutput
+
+        output = DirectoryOutput('tmp')
+        output.write_page('x.rst', ['a', 'b'])
+        self.assertRaises(RuntimeError, output.write_page, 'y.rst', self.failing_chunks())
+        self.assertEqual(os.listdir('tmp'), ['x.rst'])
+        with open('tmp/x.rst') as page:
+            self.assertEqual(page.read(), 'ab')
+
+    def test_threaded_directory_output(self):
+        """
+        Test ThreadedDirectoryOutput
+        """
+
+        from paramcomparison.outputs import ThreadedDirectoryOutput
+
+        self.pc.generate_pages('tmp', RstWriter(), 'a', 'b')
+        with ThreadedDirectoryOutput('tmp2', queue_size = 2, batch_size = 100) as output:
+            self.pc.generate_pages(output, RstWriter(), 'a', 'b')
+            self.pc.generate_leaderboard_page(output, RstWriter(), 3)
+            self.assertRaises(RuntimeError, output.write_page, 'y.rst', self.failing_chunks())
+        self.assertEqual(sorted(os.listdir('tmp2')), ['c.rst', 'd.rst', 'leaderboard.rst'])
+        for name in ('c.rst', 'd.rst'):
+            with open(os.path.join('tmp', name)) as f1:
+                with open(os.path.join('tmp2', name)) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+        # pages written from several threads don't interleave
+        from multiprocessing.pool import ThreadPool
+        def chunks(i):
+            for j in range(100):
+                yield str(i)
+        pool = ThreadPool(4)
+        with ThreadedDirectoryOutput('tmp3', batch_size = 1) as output:
+            pool.map(lambda i: output.write_page('{}.txt'.format(i), chunks(i)), range(8))
+        pool.close()
+        pool.join()
+        for i in range(8):
+            with open(os.path.join('tmp3', '{}.txt'.format(i))) as page:
+                self.assertEqual(page.read(), str(i) * 100)
+
+        # errors of the background thread are raised
+        output = ThreadedDirectoryOutput('tmp3')
+        output.write_page('x', ['a'])
+        output.write_page(os.path.join('x', 'y.rst'), ['a']) # x is not a directory
+        self.assertRaises(EnvironmentError, output.close)
+
+    def test_directory_output_subdirectories(self):
+        """
+        Test the pages of pivots written to directory outputs
+        """
+
+        from paramcomparison.outputs import DirectoryOutput, ThreadedDirectoryOutput
+
+        self.pc.generate_pivots('tmp', RstWriter(), [('a', 'b'), ('c', 'd')])
+        for output in (DirectoryOutput('tmp2'), ThreadedDirectoryOutput('tmp3')):
+            with output:
+                self.pc.generate_pivots(output, RstWriter(), [('a', 'b'), ('c', 'd')], jobs = 2)
+            for name in ('a-b/c.rst', 'a-b/d.rst', 'c-d/a.rst', 'c-d/b.rst'):
+                with open(os.path.join('tmp', name)) as f1:
+                    with open(os.path.join(output.outdir, name)) as f2:
+                        self.assertEqual(f1.read(), f2.read())
+            self.assertEqual(sorted(os.listdir(os.path.join(output.outdir, 'a-b'))),
+                             ['c.rst', 'd.rst'])
+
+    def test_archive_output(self):
+        """
+        Test ArchiveOutput and read_page
+        """
+
+        from paramcomparison.outputs import ArchiveOutput, read_page
+
+        self.pc.generate_pages('tmp', RstWriter(), 'a', 'b')
+        for ext in ('zip', 'tar.gz'):
+            path = os.path.join('tmp', 'pages.' + ext)
+            with ArchiveOutput(path) as output:
+                self.pc.generate_pages(output, RstWriter(), 'a', 'b')
+                self.pc.generate_pages(output, HtmlWriter(), 'a', 'b')
+            self.assertEqual(output.members, ['c.rst', 'd.rst', 'c.html', 'd.html'])
+            self.assertEqual(read_page(path, 'index.txt'), 'c.rst\nd.rst\nc.html\nd.html\n')
+            with open('tmp/d.rst') as page:
+                self.assertEqual(read_page(path, 'd.rst'), page.read())
+            self.assertRaises(KeyError, read_page, path, 'e.rst')
+
+        self.assertRaises(ValueError, ArchiveOutput, 'tmp/pages.rar')
+
+        # no partially written page is added, whether it is kept in memory or on disk
+        for ext in ('zip', 'tar.gz'):
+            for spool_size in (1, 1 << 20):
+                path = os.path.join('tmp', 'failed.' + ext)
+                with ArchiveOutput(path, spool_size = spool_size) as output:
+                    output.write_page('x.rst', ['a', 'b'])
+                    self.assertRaises(RuntimeError, output.write_page, 'y.rst',
+                                      self.failing_chunks())
+                self.assertEqual(output.members, ['x.rst'])
+                self.assertEqual(read_page(path, 'x.rst'), 'ab')
+                self.assertRaises(KeyError, read_page, path, 'y.rst')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree('tmp', True)
+        shutil.rmtree('tmp2', True)
+        shutil.rmtree('tmp3', True)
+
 class TestReader(unittest.TestCase):
     def test_abstract(self):
         from paramcomparison.readers import Reader
         self.assertRaises(TypeError, Reader)
 
+class TestUserFunctionReader(unittest.TestCase):
+    """
+    Test the class readers.UserFunctionReader
+    """
+
+    def setUp(self):
+        self.calls = []
+
+        def func(params, data):
+            self.calls.append(params)
+            return params['a'] * data
+
+        self.func = func
+
+    def test_no_cache(self):
+        """
+        Test reading without memoization
+        """
+
+        r = UserFunctionReader(self.func, 2)
+        self.assertEqual(r.read({'a': 1}), 2)
+        self.assertEqual(r.read({'a': 1}), 2)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(r.cache_info()['misses'], 0)
+
+    def test_cache_size(self):
+        """
+        Test memoization bounded by the number of entries
+        """
+
+        r = UserFunctionReader(self.func, 2, cache_size = 2)
+        self.assertEqual(r.read({'a': 1, 'b': [1, 2]}), 2)
+        self.assertEqual(r.read({'b': [1, 2], 'a': 1}), 2) # order doesn't matter
+        self.assertEqual(len(self.calls), 1)
+        r.read({'a': 2})
+        r.read({'a': 1, 'b': [1, 2]}) # now a = 2 is the least recently used
+        r.read({'a': 3})
+        self.assertEqual(r.cache_info(), {'hits': 2, 'misses': 3, 'size': 2,
+                                          'bytes': r.cache_info()['bytes']})
+        r.read({'a': 2}) # evicted
+        self.assertEqual(len(self.calls), 4)
+        r.read({'a': 1, 'b': [1, 2]}) # evicted by a = 2
+        self.assertEqual(len(self.calls), 5)
+
+        r.cache_clear()
+        self.assertEqual(r.cache_info(), {'hits': 0, 'misses': 0, 'size': 0, 'bytes': 0})
+
+    def test_cache_bytes(self):
+        """
+        Test memoization bounded by the approximate size
+        """
+
+        r = UserFunctionReader(lambda params, data: 'x' * params['n'], None, cache_bytes = 10000)
+        for n in range(10):
+            r.read({'n': 3000})
+            r.read({'n': n})
+        info = r.cache_info()
+        self.assertLessEqual(info['bytes'], 10000)
+        self.assertEqual(info['hits'], 9)
+        self.assertGreater(info['size'], 1)
+
 class TestWriter(unittest.TestCase):
     def test_abstract(self):
         from paramcomparison.writers import Writer